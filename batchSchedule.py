@@ -0,0 +1,83 @@
+# Creates a schedule from the command line, without the web app:
+#   python batchSchedule.py events.csv locations.csv --preferences preferences.json --days M T W R F --start 6:00 --end 24:00 \
+#       --interval 10 --gap 10 --seed 1 2 3 --output classroom.csv --metrics metrics.json [--figure schedule.html]
+import argparse, csv, json, sys, time
+
+import classroomArrangement as ca
+
+
+# reads the command line arguments
+def parseArguments(arguments):
+    parser = argparse.ArgumentParser(description="Places the events of a csv file in the locations of another csv file.")
+    parser.add_argument("events", help="csv file with the events (crs_* or event_* columns)")
+    parser.add_argument("locations", help="csv file with the locations (Location, Capacity, Features)")
+    parser.add_argument("--preferences", help="json file with the preferred buildings of each department")
+    parser.add_argument("--days", nargs="+", default=["M", "T", "W", "R", "F"], help="day codes in the schedule (Su M T W R F Sa)")
+    parser.add_argument("--start", default="6:00", help="start of a day, HH:MM")
+    parser.add_argument("--end", default="24:00", help="end of a day, HH:MM")
+    parser.add_argument("--interval", type=int, default=10, help="minutes in a time interval")
+    parser.add_argument("--gap", type=int, default=10, help="minutes between two events in the same location")
+    parser.add_argument("--seed", type=int, nargs="+", default=[0], help="seed of the schedule; with several seeds the best schedule is kept")
+    parser.add_argument("--time-budget", type=float, help="seconds to spend on the seeds when several are given")
+    parser.add_argument("--workers", type=int, help="processes used for several seeds (default: all cores)")
+    parser.add_argument("--improve", type=float, default=0, help="seconds of local search after the placement")
+    parser.add_argument("--output", default="classroom.csv", help="csv file for the placed events")
+    parser.add_argument("--metrics", help="json file for the metrics of the schedule")
+    parser.add_argument("--figure", help="html file for the schedule figure (needs plotly)")
+    parser.add_argument("--snapshot", help=".npz file to save the finished schedule to (see classroomArrangement.loadSnapshot)")
+    return parser.parse_args(arguments)
+
+
+# writes the placed events one row at a time
+def writeEvents(schedule, allEvents, fileName):
+    with open(fileName, "w", newline="") as file:
+        writer = None
+        for row in schedule.exportRows(sorted(allEvents, key=lambda event: str(event.eventCode))):
+            if writer is None:
+                writer = csv.DictWriter(file, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+
+
+# returns the metrics of the schedule as a dictionary that can be saved as json
+def getMetricsReport(schedule, allEvents, seconds):
+    return dict(seed=schedule.seed, events=len(allEvents), locations=len(schedule.locations), seconds=round(seconds, 3),
+                desiredLocation=schedule.metrics[0], sameBuilding=schedule.metrics[1], preferredBuilding=schedule.metrics[2],
+                unpreferredLocation=schedule.metrics[3], unscheduledLocations=len(schedule.getLocationsOfBuilding("UN")),
+                arrangedLocations=len(schedule.getLocationsOfBuilding("AR")), improvement=schedule.improvement)
+
+
+def main(arguments=None):
+    args = parseArguments(arguments)
+    errors = ca.validateEventTable(args.events) + ca.validateLocationTable(args.locations)
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        sys.exit(1)
+    startTime = time.time()
+    allEvents = ca.getAllEvents(args.events)
+    schedule = ca.Schedule(ca.getAllLocations(args.locations), time=ca.Time(args.start, args.end, args.days),
+                           interval=args.interval, timeGap=args.gap)
+    if args.preferences:
+        schedule.updateLocationPreferences(args.preferences)
+    if len(args.seed) > 1:
+        schedule, seed = schedule.searchSchedule(allEvents, args.seed, args.time_budget, args.workers)
+        allEvents = schedule.events     # the search works on copies of the events
+    else:
+        schedule.createSchedule(allEvents, args.seed[0])
+    if args.improve > 0:
+        schedule.improveSchedule(args.improve, schedule.seed)
+
+    writeEvents(schedule, allEvents, args.output)
+    report = getMetricsReport(schedule, allEvents, time.time() - startTime)
+    if args.metrics:
+        with open(args.metrics, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.figure:
+        schedule.visualizeSchedule().write_html(args.figure)
+    if args.snapshot:
+        schedule.saveSnapshot(args.snapshot)
+    print(json.dumps(report), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
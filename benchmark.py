@@ -0,0 +1,165 @@
+# Measures the scheduler on generated events and locations:
+#   python benchmark.py --events 5000 --rooms 600 --buildings 40 --output benchmark.json [--baseline old.json]
+# Every step is timed separately and the results (wall time, peak memory, placement attempts) are saved as json,
+# so that a run can be compared with a baseline saved earlier.
+import argparse, contextlib, io, json, os, sys, tempfile, time, tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import classroomArrangement as ca
+
+termDates = [("2022-01-10", "2022-05-10"), ("2022-01-10", "2022-03-10"), ("2022-03-11", "2022-05-10")]     # full term and two short sessions
+dayPatterns = [("M", "", "W", "", "F"), ("", "T", "", "R", ""), ("M", "T", "W", "R", "F"), ("M", "", "W", "", ""), ("", "", "", "", "F")]
+
+
+# returns the codes of the buildings: two or three capital letters, never AR or UN
+def getBuildingCodes(buildingCount):
+    letters = [chr(c) for c in range(ord("A"), ord("Z") + 1)]
+    codes = [a + b for a in letters for b in letters] + [a + b + c for a in letters for b in letters for c in letters]
+    return [code for code in codes if code not in ("AR", "UN")][:buildingCount]
+
+
+# returns a location table (Location, Capacity, Features) with the rooms spread over the buildings
+def generateLocations(roomCount, buildingCount, seed=0):
+    rng = np.random.default_rng(seed)
+    buildings = np.array(getBuildingCodes(buildingCount))
+    return pd.DataFrame({
+        "Location": [f"{bldg} {100 + i}" for i, bldg in enumerate(buildings[np.arange(roomCount) % buildingCount])],
+        "Capacity": rng.choice([20, 30, 40, 50, 80, 120, 200, 300], size=roomCount, p=[.15, .2, .2, .15, .12, .1, .05, .03]),
+        "Features": "Desks/Chairs",
+    })
+
+
+# returns an event table in the event_* layout. arranged and noLocation are the fractions of events with an AR or
+# no past location, noRoom the fraction with a past building but no room, and dateOverlap the fraction of events
+# that run the full term instead of one of two short sessions that do not overlap
+def generateEvents(eventCount, locations, arranged=0.02, noLocation=0.1, noRoom=0.1, dateOverlap=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    depts = np.array(getBuildingCodes(40))
+    pastRooms = locations["Location"].to_numpy()[rng.integers(0, len(locations), size=eventCount)]
+    bldg = np.array([room.split(" ")[0] for room in pastRooms], dtype=object)
+    room = np.array([room.split(" ")[1] for room in pastRooms], dtype=object)
+    kind = rng.random(eventCount)
+    bldg[kind < arranged] = "AR"
+    room[kind < arranged + noRoom] = ""
+    bldg[(kind >= arranged + noRoom) & (kind < arranged + noRoom + noLocation)] = ""
+
+    begin = 7 * 60 + 30 * rng.integers(0, 26, size=eventCount)      # 7:00 to 19:30
+    end = begin + rng.choice([50, 75, 110, 170], size=eventCount)
+    dates = np.where(rng.random(eventCount) < dateOverlap, 0, rng.integers(1, 3, size=eventCount))
+    days = np.array(dayPatterns, dtype=object)[rng.integers(0, len(dayPatterns), size=eventCount)]
+    eventDepts = depts[rng.integers(0, len(depts), size=eventCount)]
+    return pd.DataFrame({
+        "event_cde": [f"{dept} {100 + i % 400} {i % 7:02d}" for i, dept in enumerate(eventDepts)],
+        "event_title": [f"Event {i}" for i in range(eventCount)],
+        "event_enrollment": rng.integers(5, 150, size=eventCount),
+        "event_capacity": 150,
+        "max_enrollment": 150,
+        "begin_time": [f"{t // 60}:{t % 60:02d}" for t in begin],
+        "end_time": [f"{t // 60}:{t % 60:02d}" for t in end],
+        "begin_date": [termDates[d][0] for d in dates],
+        "end_date": [termDates[d][1] for d in dates],
+        "bldg_cde": bldg,
+        "room_cde": room,
+        "monday_cde": days[:, 0], "tuesday_cde": days[:, 1], "wednesday_cde": days[:, 2], "thursday_cde": days[:, 3], "friday_cde": days[:, 4],
+        "saturday_cde": "", "sunday_cde": "",
+    })
+
+
+# runs every step once and returns the seconds spent in each of them
+def runSteps(eventFile, locationFile, args):
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):     # keeps the output of the steps out of the results
+        start = time.perf_counter()
+        allEvents = ca.getAllEvents(eventFile)
+        timings["getAllEvents"] = time.perf_counter() - start
+        start = time.perf_counter()
+        schedule = ca.Schedule(ca.getAllLocations(locationFile), time=ca.Time("6:00", "24:00", ["M", "T", "W", "R", "F"]),
+                               interval=args.interval, timeGap=args.gap)
+        timings["getAllLocations"] = time.perf_counter() - start
+        start = time.perf_counter()
+        schedule.createSchedule(allEvents, args.seed)
+        timings["createSchedule"] = time.perf_counter() - start
+        for phase, seconds in schedule.stats.timers.items():
+            timings["createSchedule." + phase] = seconds
+        if not args.no_figure:
+            start = time.perf_counter()
+            schedule.visualizeSchedule()
+            timings["visualizeSchedule"] = time.perf_counter() - start
+        start = time.perf_counter()
+        schedule.exportToCSV(allEvents)(io.StringIO())
+        timings["exportToCSV"] = time.perf_counter() - start
+    return timings, schedule
+
+
+# runs the benchmark and returns the results as a dictionary
+def runBenchmark(args):
+    with tempfile.TemporaryDirectory() as folder:
+        locations = generateLocations(args.rooms, args.buildings, args.seed)
+        events = generateEvents(args.events, locations, args.arranged, args.no_location, args.no_room, args.date_overlap, args.seed)
+        locationFile, eventFile = os.path.join(folder, "locations.csv"), os.path.join(folder, "events.csv")
+        locations.to_csv(locationFile, index=False)
+        events.to_csv(eventFile, index=False)
+
+        timings, schedule = runSteps(eventFile, locationFile, args)
+        peakMemory = None
+        if not args.no_memory:      # tracemalloc slows everything down, so the memory is measured in a second run
+            tracemalloc.start()
+            runSteps(eventFile, locationFile, args)
+            peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return dict(workload=dict(events=args.events, rooms=args.rooms, buildings=args.buildings, arranged=args.arranged,
+                              noLocation=args.no_location, noRoom=args.no_room, dateOverlap=args.date_overlap,
+                              interval=args.interval, gap=args.gap, seed=args.seed),
+                timings=timings, peakMemory=peakMemory, placementAttempts=schedule.stats.counters.get("attempts", 0),
+                rejections={name: amount for name, amount in schedule.stats.counters.items() if name.startswith("rejected.")},
+                metrics=schedule.metrics, locations=len(schedule.locations))
+
+
+# returns the steps that took more than (1 + tolerance) times as long as in the baseline
+def findRegressions(results, baseline, tolerance):
+    regressions = {}
+    for step, seconds in results["timings"].items():
+        before = baseline["timings"].get(step)
+        if before and seconds > before * (1 + tolerance) and seconds - before > 0.01:
+            regressions[step] = dict(baseline=before, current=seconds)
+    if baseline.get("peakMemory") and results["peakMemory"] and results["peakMemory"] > baseline["peakMemory"] * (1 + tolerance):
+        regressions["peakMemory"] = dict(baseline=baseline["peakMemory"], current=results["peakMemory"])
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Times the scheduler on generated events and locations.")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--buildings", type=int, default=20)
+    parser.add_argument("--arranged", type=float, default=0.02, help="fraction of events with an AR past location")
+    parser.add_argument("--no-location", type=float, default=0.1, help="fraction of events without a past location")
+    parser.add_argument("--no-room", type=float, default=0.1, help="fraction of events with a past building but no room")
+    parser.add_argument("--date-overlap", type=float, default=0.5, help="fraction of events that run the full term")
+    parser.add_argument("--interval", type=int, default=10)
+    parser.add_argument("--gap", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-figure", action="store_true", help="do not time visualizeSchedule (needs plotly)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the second run that measures the peak memory")
+    parser.add_argument("--output", help="json file for the results")
+    parser.add_argument("--baseline", help="json file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown compared to the baseline")
+    args = parser.parse_args(arguments)
+
+    results = runBenchmark(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = findRegressions(results, json.load(file), args.tolerance)
+        if regressions:
+            print("Regressions:", json.dumps(regressions, indent=2))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,33 @@
 import pandas as pd
-import plotly.express as px
 import datetime
 import numpy as np
 import re
-import copy, json, random
+import copy, json, random, bisect, os, time, math, sys, queue, multiprocessing
 
 ############################################################
 ##################### COURSE class #########################
 ############################################################
 class Event:
-    def __init__(self, eventCode, name, seats, capacity, maxCapacity, time, pastLocation, beginDate, endDate):
+    # slots instead of a __dict__ per event; codes and dates repeat across events, so they are interned and shared
+    __slots__ = ('eventCode', 'dept', 'name', 'seats', 'capacity', 'maxCapacity', 'time', 'beginDate', 'endDate', 'beginDay', 'endDay',
+                 'indices', '__historicalLocations', 'bldgCode', 'roomNumber', 'placedLocation', 'metric')
+
+    def __init__(self, eventCode, name, seats, capacity, maxCapacity, time, pastLocation, beginDate, endDate, dept=None, beginDay=None, endDay=None):
         self.eventCode = eventCode
-        self.dept = getDept(eventCode)
+        self.dept = sys.intern(getDept(eventCode) if dept is None else dept)
         self.name = name
         self.seats = seats
         self.capacity = capacity
         self.maxCapacity = maxCapacity
         self.time = time
-        self.beginDate = str(beginDate).split(" ")[0]
-        self.endDate = str(endDate).split(" ")[0]
+        self.beginDate = sys.intern(str(beginDate).split(" ")[0])
+        self.endDate = sys.intern(str(endDate).split(" ")[0])
+        self.beginDay = toDayOrdinal(self.beginDate, datetime.date.min.toordinal()) if beginDay is None else beginDay  # dates as day ordinals, a missing date leaves the range open
+        self.endDay = toDayOrdinal(self.endDate, datetime.date.max.toordinal()) if endDay is None else endDay
         self.indices = []   # keeps track of where the events are in the schedule
         self.__historicalLocations = [pastLocation]   # keeps track of the locations that the event was in the past
-        self.bldgCode = pastLocation.split(" ")[0]
-        self.roomNumber = pastLocation.split(" ")[1]
+        self.bldgCode = sys.intern(pastLocation.split(" ")[0])
+        self.roomNumber = sys.intern(pastLocation.split(" ")[1])
         self.placedLocation = ""
         self.metric = 0
         # self.requiredFeatures = requiredFeatures
@@ -60,11 +65,13 @@ class Event:
 
 
 class Location:
-    def __init__(self, name, capacity, locationFeatures):
+    __slots__ = ('name', 'capacity', 'locationFeatures', 'building')
+
+    def __init__(self, name, capacity, locationFeatures, building=None):
         self.name = name
         self.capacity = capacity
         self.locationFeatures = locationFeatures
-        self.building = getDept(name)
+        self.building = sys.intern(getDept(name) if building is None else building)
 
     #########################################################################
 
@@ -77,12 +84,23 @@ class Location:
 ############################################################
 
 
+# Time objects are never changed after they are created, so events with the same times and days can share one
 class Time:
-    def __init__(self, beginTime, endTime, days):
+    __slots__ = ('beginTime', 'endTime', 'days', 'beginMinutes', 'endMinutes')
+
+    def __init__(self, beginTime, endTime, days, beginMinutes=None, endMinutes=None):
         self.beginTime = beginTime
         self.endTime = endTime
-        self.totalTime = beginTime + " - " + endTime
         self.days = removeNans(days)
+        self.beginMinutes = toMinutes(beginTime) if beginMinutes is None else beginMinutes  # times as minutes since midnight
+        self.endMinutes = toMinutes(endTime) if endMinutes is None else endMinutes
+
+    #########################################################################
+
+    # the time as ..:.. - ..:.., built when it is asked for instead of being stored with every event
+    @property
+    def totalTime(self):
+        return self.beginTime + " - " + self.endTime
 
     #########################################################################
 
@@ -95,6 +113,9 @@ class Time:
 # takes in a list and returns a list with no nans
 removeNans = lambda lst: [x for x in lst if str(x) not in ['nan', ' ']]
 
+# converts time:string of the form ..:.. to the minutes since midnight
+toMinutes = lambda time: 60 * int(time.split(":")[0]) + int(time.split(":")[1])
+
 
 ############################################################
 ################### SCHEDULE class #########################
@@ -107,51 +128,155 @@ class Schedule:
         self.interval = interval
         self.timeGap = timeGap
 
-        self.dayInterval = int(60 / interval) * (int(str(subtractTime(self.schTime.beginTime, self.schTime.endTime)).split(":")[0]))  # time intervals in a day
+        self.dayInterval = int(60 / interval) * ((self.schTime.endMinutes - self.schTime.beginMinutes) // 60)  # time intervals in a day
         self.weekInterval = self.dayInterval * len(self.schTime.days)  # total time intervals of a week
         self.dayTime = {self.schTime.days[i]: i * self.dayInterval for i in range(len(self.schTime.days))}  # to help place events in the right time in the right day.
-        self.schedule = {str(rms.name): [0 for _ in range(self.weekInterval)] for rms in self.locations}
+        self.__grid = np.zeros((max(len(self.locations), 1), self.weekInterval), dtype=np.uint16)  # rows are locations, columns are time intervals and cells are event ids (0 = free)
+        self.__locationRows = {}  # location name -> row of the grid
+        self.__intervalIndex = {}  # location name -> IntervalIndex of the events placed there
+        self.__locationsByName = {}  # location name -> location
+        self.__locationsByBuilding = {}  # building code -> locations of the building, in the order of self.locations
+        self.__candidateLocations = {}  # ("dept", dept) or ("building", bldg) -> groups of locations sorted by capacity, cleared when locations are added
+        for rms in self.locations:
+            self.__indexLocation(rms)
+        self.__eventIds = {}  # event object -> id used in the grid
+        self.__timeIndices = {}  # event object -> list of (start, end) indices of the event in this schedule
+        self.__idEvents = [0]  # id -> event object; id 0 is reserved for free slots
         self.locationPreferences = {}
         self.metrics = []
+        self.events = []  # events of the last createSchedule run
+        self.seed = None  # seed of the last createSchedule run
+        self.improvement = {}  # report of the last improveSchedule run
+        self.stats = ScheduleStats()  # timers and counters of the last createSchedule run; set stats.enabled = False to turn them off
         self.__unscheduledLocationCount = 0
         self.__arrangedLocationCount = 0
         self.__arrangedLocations = []
+        self.__unscheduledLocations = []
+
+    #########################################################################
+
+    # the schedule matrix: one row of event ids per location, one column per time interval
+    @property
+    def schedule(self):
+        return self.__grid[:len(self.__locationRows)]
+
+    #########################################################################
+
+    # private method that adds a location to the name and building indexes and gives it a row in the grid
+    def __indexLocation(self, location):
+        self.__locationsByName[str(location.name)] = location
+        self.__locationsByBuilding.setdefault(str(location.name).split(" ")[0], []).append(location)
+        self.__addRow(str(location.name))
+        self.__candidateLocations = {}
+
+    #########################################################################
+
+    # returns the location with the given name (e.g. "BA 10.0" finds "BA 10") or None if there is no such location
+    def getLocation(self, locationName):
+        return self.__locationsByName.get(normalizeLocationName(locationName))
+
+    #########################################################################
+
+    # returns the locations of the building specified; the list is shared with the index and must not be modified
+    def getLocationsOfBuilding(self, bldg):
+        return self.__locationsByBuilding.get(bldg, [])
+
+    #########################################################################
+
+    # private method that returns the groups of locations an event of a department tries in the 3rd phase of createSchedule:
+    # each building in its location preferences, then every other non-arranged location. Each group is sorted by capacity
+    def __getCandidateGroups(self, dept):
+        groups = self.__candidateLocations.get(("dept", dept))
+        if groups is None:
+            groups = [sortByCapacity(self.getLocationsOfBuilding(bldg)) for bldg in self.getLocationPreferences().get(dept, [])]
+            excluded = set(location for capacities, locations in groups for location in locations).union(self.__arrangedLocations)
+            otherLocations = [location for location in set(self.locations) if location not in excluded]
+            otherLocations.sort(key=lambda x: x.name)
+            groups.append(sortByCapacity(otherLocations))
+            self.__candidateLocations[("dept", dept)] = groups
+        return groups
+
+    #########################################################################
+
+    # private method that returns the locations of a building as a group sorted by capacity
+    def __getBuildingGroups(self, bldg):
+        groups = self.__candidateLocations.get(("building", bldg))
+        if groups is None:
+            groups = [sortByCapacity(self.getLocationsOfBuilding(bldg))]
+            self.__candidateLocations[("building", bldg)] = groups
+        return groups
+
+    #########################################################################
+
+    # private method that yields the locations of the groups that can seat an event, group by group and the smallest
+    # location of a group first (best fit); bisect skips the locations that are too small without trying them
+    def __getFittingLocations(self, groups, seats):
+        for capacities, locations in groups:
+            yield from locations[bisect.bisect_left(capacities, seats):]
+
+    #########################################################################
+
+    # private method that adds an empty row for a location, doubling the grid when it is full
+    def __addRow(self, locationName):
+        if locationName in self.__locationRows:
+            return
+        if len(self.__locationRows) == self.__grid.shape[0]:
+            self.__grid = np.vstack([self.__grid, np.zeros_like(self.__grid)])
+        self.__locationRows[locationName] = len(self.__locationRows)
+        self.__intervalIndex[locationName] = IntervalIndex()
+
+    #########################################################################
+
+    # private method that returns the id of an event in the grid, giving it a new one if it has none
+    def __getEventId(self, event):
+        eventId = self.__eventIds.get(event)
+        if eventId is None:
+            eventId = len(self.__idEvents)
+            if eventId > np.iinfo(self.__grid.dtype).max:  # widen the grid once the ids no longer fit
+                self.__grid = self.__grid.astype(np.uint32)
+            self.__eventIds[event] = eventId
+            self.__idEvents.append(event)
+        return eventId
+
+    #########################################################################
+
+    # private method that returns the unique events placed in a location
+    def __getEventsInLocation(self, locationName):
+        return [self.__idEvents[i] for i in self.__intervalIndex[locationName].getEventIds()]
 
     #########################################################################
 
     # updates the schedule matrix by placing a event object in the allocated time
     def placeAEvent(self, event, location, forcePlace = False):
-        if toDateTime(event.time.beginTime) < toDateTime(self.schTime.beginTime) or toDateTime(event.time.endTime) > toDateTime(self.schTime.endTime):          # check if the time falls within a day
-            print(f"The time {event.time.beginTime, event.time.endTime} exceeds the specified schedule time!")
+        self.stats.count("attempts")
+        if event.time.beginMinutes < self.schTime.beginMinutes or event.time.endMinutes > self.schTime.endMinutes:          # check if the time falls within a day
+            self.stats.count("rejected.outOfWindow")
             return False
-        timeIndices = self.__convertToScheduleTime(event.time)
+        timeIndices = self.__getTimeIndices(event)
         event.updateIndices(timeIndices)  # if there are indices present for that event, it is already placed
+        row = self.schedule[self.__locationRows[location.name]]
         if not forcePlace:                  # will not run these conditions if you are trying to force place a event in a location
             if event.seats > location.capacity:  # check if there are enough seats in the location
-                #print(f"{event.name} exceeds location capacity at {location.name}")
+                self.stats.count("rejected.capacity")
                 event.indices = []
                 return False
+            index = self.__intervalIndex[location.name]
+            gap = max(self.timeGap // self.interval, 0)
             for start, end in timeIndices:
-                if start != 0 and checkTimeGap(self.schedule[location.name], start, end, self.interval, self.timeGap):     # check if there are gaps before the event
-                    #print(f"There needs to be a {self.timeGap} minute gap between {self.schedule[location.name][start - 1]} and {self.schedule[location.name][end]} at {location.name}")
+                lo, hi = getGapWindow(start, end, gap, self.dayInterval)
+                if row[lo:hi].any() and index.overlaps(lo, hi, event.beginDay, event.endDay):
+                    # an event that runs on the same dates is in that time block or within the time gap around it
+                    self.stats.count("rejected.slotConflict" if index.overlaps(start, end, event.beginDay, event.endDay) else "rejected.timeGap")
                     event.indices = []
                     return False
-                if self.schedule[location.name][start:end] != [0] * (end - start):  # check if there are any events in that time block
-                    #print(f"{event.name} cannot be placed in the time slot {(event.time.beginTime, event.time.endTime)} as {location.name} is occupied!")
-                    for sub_event in self.schedule[location.name][start:end]:
-                        if sub_event != 0:
-                            if not (toDate(sub_event.beginDate) > toDate(event.endDate)) or (toDate(sub_event.endDate) < toDate(event.beginDate)):
-                                # If the event does NOT:
-                                # a) begin after you end
-                                # b) end before you begin
-                                # reject the event
-                                event.indices = []
-                                return False
-                
-                
+
+
         # if all the conditions satisfy, then only place the indices
+        eventId = self.__getEventId(event)
+        row = self.schedule[self.__locationRows[location.name]]  # the grid may have been widened for the new id
         for start, end in timeIndices:
-            self.schedule[location.name][start:end] = [event] * (end - start)  # placing the event in the schedule
+            row[start:end] = eventId  # placing the event in the schedule
+            self.__intervalIndex[location.name].add(start, end, event.beginDay, event.endDay, eventId)
             event.placedLocation = location.name
         return True
 
@@ -159,29 +284,63 @@ class Schedule:
 
     # private method which converts real time to a list of indices to be placed in the schedule
     def __convertToScheduleTime(self, time):
-        return [(getIndex(str(subtractTime(self.schTime.beginTime, time.beginTime) / self.interval)) + self.dayTime[day],
-                 getIndex(str(subtractTime(self.schTime.beginTime, time.endTime) / self.interval)) + self.dayTime[day]) for day in
-                time.days if day in self.dayTime]
-
-    #########################################################################
-
-    # generates a plot of all the events that are currently in the schedule
-    def visualizeSchedule(self, location="All", show="Code"):
-        df = []
-        tempdf = pd.DataFrame([dict(Location=x.name) for x in self.locations]).sort_values("Location")
-        tempdf.reset_index(drop=True, inplace=True)
-        displayLocations = self.locations
-        if location != "All":
-            displayLocations = [x for x in self.locations if x.name == location]
-        for eachLocation in displayLocations:
-            df += self.__getLocationAndEventInfo(eachLocation)
-        df = pd.DataFrame(df)
-        df['delta'] = df['Finish'] - df['Start']
-        df = df.sort_values('Location')
-        df.reset_index(drop=True, inplace=True)
-        fig = px.timeline(df, x_start="Start", x_end="Finish", y="Location", color=show, hover_name="Event", hover_data=             # initializing the figure
-            {'Start': False, 'Finish': False, 'Time': True, 'Location': True, 'Dept': False, 'Event': False, 'Code': True}, template="plotly_dark")
-        fig.update_yaxes(autorange="reversed")  # starts the first location at the top of Y-axis rather than at y=0
+        begin = (time.beginMinutes - self.schTime.beginMinutes) // self.interval
+        end = (time.endMinutes - self.schTime.beginMinutes) // self.interval
+        return [(begin + self.dayTime[day], end + self.dayTime[day]) for day in time.days if day in self.dayTime]
+
+    #########################################################################
+
+    # private method that returns the indices of an event, converting its time only the first time it is asked for
+    def __getTimeIndices(self, event):
+        timeIndices = self.__timeIndices.get(event)
+        if timeIndices is None:
+            timeIndices = self.__convertToScheduleTime(event.time)
+            self.__timeIndices[event] = timeIndices
+        return timeIndices
+
+    #########################################################################
+
+    # generates a plot of all the events that are currently in the schedule. Events get one color (and one trace) per value of show
+    # (Code, Dept, Event, Location or Time); past maxTraces values the smallest groups share an "Other" trace.
+    # renderMode "bars" draws hoverable bars, "webgl" draws lines with WebGL for very large schedules and "auto" picks one of them.
+    def visualizeSchedule(self, location="All", show="Code", renderMode="auto", maxTraces=200):
+        import plotly.graph_objects as go     # plotly is only needed for figures, so batch runs do not load it
+        groups = {}     # value of show -> (locations, starts, lengths, hover info) of the bars with that color
+        shownLocations = []
+        for name in sorted(self.__locationRows) if location == "All" else [location]:
+            placedEvents = self.__getEventsInLocation(name)
+            if placedEvents:
+                shownLocations.append(name)
+            for eachEvent in placedEvents:
+                info = dict(Code=eachEvent.eventCode, Dept=eachEvent.dept, Event=eachEvent.name, Location=name, Time=eachEvent.time.totalTime)
+                group = groups.setdefault(info[show], ([], [], [], []))
+                for start, end in eachEvent.indices:
+                    group[0].append(name)
+                    group[1].append(start)
+                    group[2].append(end - start)
+                    group[3].append((eachEvent.name, info["Time"], info["Code"]))
+        if len(groups) > maxTraces:      # too many traces slow the browser down more than the bars themselves
+            ordered = sorted(groups.items(), key=lambda item: len(item[1][0]), reverse=True)
+            other = ([], [], [], [])
+            for key, group in ordered[maxTraces - 1:]:
+                for column, values in zip(other, group):
+                    column.extend(values)
+            groups = dict(ordered[:maxTraces - 1] + [("Other", other)])
+        if renderMode == "auto":
+            renderMode = "webgl" if len(shownLocations) > 1000 or sum(len(group[0]) for group in groups.values()) > 20000 else "bars"
+
+        fig = go.Figure()
+        for key, (names, starts, lengths, hoverInfo) in groups.items():
+            if renderMode == "webgl":       # every bar becomes a thick line segment, segments are separated by None
+                x = [value for start, length in zip(starts, lengths) for value in (start, start + length, None)]
+                y = [value for name in names for value in (name, name, None)]
+                fig.add_trace(go.Scattergl(x=x, y=y, mode="lines", name=str(key), line=dict(width=max(2, min(12, 800 // max(len(shownLocations), 1)))),
+                                           hoverinfo="y+name"))
+            else:
+                fig.add_trace(go.Bar(x=lengths, base=starts, y=names, orientation="h", name=str(key), customdata=hoverInfo,
+                                     hovertemplate="<b>%{customdata[0]}</b><br>Time=%{customdata[1]}<br>Location=%{y}<br>Code=%{customdata[2]}<extra></extra>"))
+        fig.update_layout(template="plotly_dark", barmode="overlay", legend_title_text=show)
+        fig.update_yaxes(type="category", categoryorder="array", categoryarray=shownLocations, autorange="reversed")  # starts the first location at the top of Y-axis rather than at y=0
         dayLines = [i for i in range(self.dayInterval, self.weekInterval+1, self.dayInterval)]  # indices which denote a new day
         for i in range(len(dayLines)):
             fig.add_vline(x=dayLines[i], annotation_text=self.schTime.days[i], annotation_position="top left")  # adding a vertical line in those indices
@@ -189,22 +348,140 @@ class Schedule:
                        ticktext=getTimeRange(self)))        # sets the time in the x-axis
         fig.update_layout(title="Event Arrangement", height=1000)
         fig.layout.xaxis.type = 'linear'
-        for i in range(len(fig.data)):                              # This is to display the boxes of events in the figure
-            fig.data[i].x = df[df[show] == df[show].unique()[i]]["delta"].tolist()
         return fig
 
     #########################################################################
 
-    # private method that gets you all the info as a list of dictionaries of location and event startings and endings to be visualized
-    def __getLocationAndEventInfo(self, location):
-        uniqueEvents = list(set(self.schedule[location.name]))
-        df = []
-        for eachEvent in uniqueEvents:
-            if eachEvent != 0:
-                for start, end in eachEvent.indices:
-                    df.append(dict(Location=eachEvent.placedLocation, Start=start, Finish=end, Event=eachEvent.name,
-                                   Time=eachEvent.time.totalTime, Dept=eachEvent.dept, Code=eachEvent.eventCode))
-        return df
+    # returns, before any scheduling, how many events each building needs at the same time per capacity tier: for every
+    # tier the largest number of events of the building (by past location) with at least that many seats that overlap
+    # in a slot and a date, with the time gap (clipped to the day) added to their end. Rooms is the number of locations of the building with
+    # at least that capacity and Shortfall how many of those are missing; the "All" rows cover the whole campus
+    def getDemandReport(self, events, tiers=(1, 25, 50, 100, 200)):
+        gap = max(self.timeGap // self.interval, 0)
+        intervals = {}     # building -> (seats, (start, end, beginDay, endDay)) of its events
+        for event in events:
+            if event.bldgCode == "AR" or event.time.beginMinutes < self.schTime.beginMinutes or event.time.endMinutes > self.schTime.endMinutes:
+                continue
+            for start, end in self.__getTimeIndices(event):
+                interval = (event.seats, (start, getGapWindow(start, end, gap, self.dayInterval)[1], event.beginDay, event.endDay))
+                intervals.setdefault("All", []).append(interval)
+                if event.bldgCode != "nan":
+                    intervals.setdefault(event.bldgCode, []).append(interval)
+        rows = []
+        for bldg, bldgIntervals in sorted(intervals.items()):
+            capacities = [location.capacity for location in (self.getLocationsOfBuilding(bldg) if bldg != "All" else self.locations)
+                          if location.name.split(" ")[0] not in ("AR", "UN")]
+            for tier in tiers:
+                demand = getMaxDepth([interval for seats, interval in bldgIntervals if seats >= tier])
+                rooms = sum(capacity >= tier for capacity in capacities)
+                rows.append(dict(Building=bldg, Seats=tier, Demand=demand, Rooms=rooms, Shortfall=max(demand - rooms, 0)))
+        return pd.DataFrame(rows, columns=["Building", "Seats", "Demand", "Rooms", "Shortfall"])
+
+    #########################################################################
+
+    # returns how much each location (groupBy="location") or building (groupBy="building") is used per time bucket of
+    # bucketMinutes, computed from the grid: the share of the time it is occupied and the share of the seats taken while
+    # it is occupied (event seats over location capacity). Both are DataFrames with one row per location/building and one column per bucket.
+    def getUtilization(self, bucketMinutes=60, groupBy="location"):
+        names = sorted(self.__locationRows, key=self.__locationRows.get)    # in the order of the rows of the grid
+        slotsPerBucket = max(1, bucketMinutes // self.interval)
+        starts = [day + slot for day in range(0, self.weekInterval, self.dayInterval) for slot in range(0, self.dayInterval, slotsPerBucket)]
+        lengths = np.diff(starts + [self.weekInterval])
+        bucketNames = [f"{self.schTime.days[start // self.dayInterval]} {minutesToTime(self.schTime.beginMinutes + (start % self.dayInterval) * self.interval)}"
+                       for start in starts]
+
+        grid = self.schedule
+        seats = np.array([0] + [event.seats if isinstance(event, Event) else 0 for event in self.__idEvents[1:]], dtype=np.float64)    # seats of each event id, 0 for unused ids
+        capacities = np.array([self.__locationsByName[name].capacity for name in names], dtype=np.float64)
+        occupied = np.add.reduceat(grid != 0, starts, axis=1, dtype=np.int64)  # occupied slots per location and bucket
+        seatSlots = np.add.reduceat(seats[grid], starts, axis=1)
+
+        labels = names if groupBy == "location" else [name.split(" ")[0] for name in names]
+        total = lambda values: pd.DataFrame(values, index=labels, columns=bucketNames).groupby(level=0, sort=True).sum()
+        occupancy = total(occupied) / total(np.broadcast_to(lengths, occupied.shape))
+        seatFill = total(seatSlots) / total(occupied * capacities[:, None]).replace(0, np.nan)
+        return occupancy, seatFill
+
+    #########################################################################
+
+    # generates a heatmap of getUtilization; value is "occupancy" or "seatFill". The size of the figure only depends
+    # on the number of locations/buildings and buckets, not on the number of events
+    def visualizeUtilization(self, bucketMinutes=60, groupBy="building", value="occupancy"):
+        import plotly.graph_objects as go     # plotly is only needed for figures, so batch runs do not load it
+        occupancy, seatFill = self.getUtilization(bucketMinutes, groupBy)
+        matrix = occupancy if value == "occupancy" else seatFill
+        fig = go.Figure(go.Heatmap(z=matrix.values, x=list(matrix.columns), y=list(matrix.index), zmin=0, zmax=1, colorscale="Viridis",
+                                   hovertemplate="%{y}<br>%{x}<br>" + value + "=%{z:.0%}<extra></extra>"))
+        fig.update_layout(template="plotly_dark", title="Location Utilization", height=1000)
+        fig.update_yaxes(type="category", autorange="reversed")
+        return fig
+
+    #########################################################################
+
+    # exports the utilization of the locations/buildings to a csv file with one row per location/building and time bucket
+    def exportUtilizationCSV(self, bucketMinutes=60, groupBy="location"):
+        occupancy, seatFill = self.getUtilization(bucketMinutes, groupBy)
+        label = "Location" if groupBy == "location" else "Building"
+        df = occupancy.rename_axis(label).reset_index().melt(id_vars=label, var_name="Time", value_name="Occupancy")
+        df["Seat_Fill"] = seatFill.rename_axis(label).reset_index().melt(id_vars=label, var_name="Time", value_name="Seat_Fill")["Seat_Fill"]
+        return df.to_csv
+
+    #########################################################################
+
+    # compares this schedule (before) with another one (after), e.g. two seeds or last term and this term. Returns a
+    # dictionary of DataFrames: "events" lists the events that moved or are only in one schedule (matched by code and title,
+    # the time, days, dates and past location of both are kept as columns and the ones that differ are named in Changed),
+    # "metrics" the metrics of both and "locations" the locations whose slots changed. Changed slots are counted on the
+    # grids, after mapping both grids to the matched events, when both use the same time slots
+    def compareSchedule(self, other):
+        keyColumns = ["Code", "Event"]
+        detailColumns = ["Time", "Days", "BeginDate", "EndDate", "PastLocation"]
+        events = self.__getEventTable(keyColumns, detailColumns).merge(other.__getEventTable(keyColumns, detailColumns), on=keyColumns + ["Occurrence"],
+                                                                        how="outer", suffixes=("Before", "After"), indicator="Status")
+        events["Status"] = events["Status"].map({"both": "moved", "left_only": "removed", "right_only": "added"})
+        changed = pd.Series("", index=events.index)      # names of the detail columns that differ, e.g. "BeginDate,EndDate"
+        for column in detailColumns:
+            differs = (events[column + "Before"] != events[column + "After"]) & (events["Status"] == "moved")
+            changed += pd.Series(np.where(differs, column + ",", ""), index=events.index)
+        events["Changed"] = changed.str.rstrip(",")
+        moved = events[events["LocationBefore"].fillna("") != events["LocationAfter"].fillna("")]
+
+        metricNames = ["desiredLocation", "sameBuilding", "preferredBuilding", "unpreferredLocation"]
+        metrics = pd.DataFrame({"Before": self.metrics or [0] * 4, "After": other.metrics or [0] * 4}, index=metricNames)
+        metrics["Change"] = metrics["After"] - metrics["Before"]
+
+        names = sorted(set(self.__locationRows) | set(other.__locationRows))
+        occupied = lambda schedule: schedule.interval * pd.Series((schedule.schedule != 0).sum(axis=1), index=list(schedule.__locationRows))
+        locations = pd.DataFrame({"MinutesBefore": occupied(self), "MinutesAfter": occupied(other)}, index=names).fillna(0).astype(np.int64)
+        if self.schedule.shape[1] == other.schedule.shape[1] and self.schTime.info() == other.schTime.info() and self.interval == other.interval:
+            keyGrids = []       # grids of the row numbers of the matched events in events, -1 for free slots
+            for schedule, suffix in [(self, "Before"), (other, "After")]:
+                idToKey = np.full(len(schedule.__idEvents), -1, dtype=np.int64)
+                ids = events["Id" + suffix].fillna(0).astype(np.int64).values
+                idToKey[ids[ids > 0]] = np.flatnonzero(ids > 0)
+                rows = [schedule.__locationRows.get(name, -1) for name in names]      # -1 picks the extra free row
+                keyGrids.append(np.vstack([idToKey[schedule.schedule], np.full((1, schedule.schedule.shape[1]), -1)])[rows])
+            locations["ChangedSlots"] = (keyGrids[0] != keyGrids[1]).sum(axis=1)
+            locations = locations[locations["ChangedSlots"] > 0]
+        else:
+            locations = locations[locations["MinutesBefore"] != locations["MinutesAfter"]]
+        columns = keyColumns + ["Occurrence", "Status", "LocationBefore", "LocationAfter", "MetricBefore", "MetricAfter", "Changed"] + \
+                  [column + suffix for column in detailColumns for suffix in ("Before", "After")]
+        return dict(events=moved[columns].reset_index(drop=True), metrics=metrics, locations=locations.rename_axis("Location").reset_index())
+
+    #########################################################################
+
+    # private method that returns a table of the events of the last run with their key and detail columns, the number of the
+    # event among the ones with the same key (Occurrence, counted in the order of the details), the location, the metric and
+    # the id in the grid (0 if not placed)
+    def __getEventTable(self, keyColumns, detailColumns):
+        table = pd.DataFrame([(event.eventCode, event.name, event.time.totalTime, ",".join(event.time.days), event.beginDate, event.endDate,
+                               event.getHistoricalLocations()[0], event.placedLocation, event.metric,
+                               self.__eventIds.get(event, 0) if event.placedLocation else 0) for event in self.events],
+                             columns=keyColumns + detailColumns + ["Location", "Metric", "Id"])
+        table = table.sort_values(keyColumns + detailColumns + ["Location"], kind="stable")
+        table["Occurrence"] = table.groupby(keyColumns).cumcount()
+        return table
 
     #########################################################################
 
@@ -230,24 +507,37 @@ class Schedule:
     def updateLocationPreferences(self, jsonFile):
         with open(jsonFile) as json_file:
             self.locationPreferences = json.load(json_file)
+        self.__candidateLocations = {}
 
     #########################################################################
 
-    # schedules events into locations in different phases
-    def createSchedule(self, events, seed=0):
-        random.seed(seed)
+    # schedules events into locations in different phases; improveTime (seconds) runs improveSchedule on the result.
+    # progress(phase, done, total) is called for every event of a phase; it can raise an exception to stop the run
+    def createSchedule(self, events, seed=0, improveTime=0, progress=None):
+        report = progress or (lambda phase, done, total: None)
+        self.events = events
+        self.seed = seed
+        self.__candidateLocations = {}  # the location preferences may have been replaced since the last run
+        self.stats.reset()
+        phaseStart = time.perf_counter()
         eventCount = 0
         failures = 0
         totalLoops = 0
         waitingList = []
         finalList = []
         unscheduled = []
-        random.shuffle(events)
-        for eachEvent in events:              # 1st phase: place events in their past location
+        arranged = []
+        random.Random(seed).shuffle(events)     # a generator of its own per shuffle, so that runs in other threads do not change the order
+        for i, eachEvent in enumerate(events):              # 1st phase: place events in their past location
+            report("pastLocation", i, len(events))
             totalLoops += 1
             pastLocation = eachEvent.getHistoricalLocations()
-            if self.__checkAndPlaceARevents(eachEvent):           # if it is arranged, then place it in the right location and move on to next loop
-                eventCount += 1
+            if eachEvent.bldgCode == "AR":           # if it is arranged, then place it in its own AR location or pack it into new ones after this loop
+                location = self.getLocation(pastLocation[0])
+                if location is not None and self.placeAEvent(eachEvent, location):
+                    eventCount += 1
+                else:
+                    arranged.append(eachEvent)
                 continue
             if eachEvent.bldgCode == "nan":  # check if the event has a past location or not
                 finalList.append(eachEvent)  # add them to a list to be added to schedule later
@@ -255,9 +545,9 @@ class Schedule:
             if eachEvent.roomNumber == "nan":  # check if historical location has a location number or not
                 waitingList.append(eachEvent)  # add them to a list to be added to schedule later
                 continue
-            locationSearch = searchForLocation(self.locations, pastLocation[0])
+            locationSearch = self.getLocation(pastLocation[0])
             if locationSearch is not None:
-                if self.placeAEvent(eachEvent, searchForLocation(self.locations, pastLocation[0])):     # if location search returns a room, then only try to place event
+                if self.placeAEvent(eachEvent, locationSearch):     # if location search returns a room, then only try to place event
                     eventCount += 1
                 else:
                     failures += 1
@@ -265,57 +555,206 @@ class Schedule:
             else:
                 failures += 1
                 waitingList.append(eachEvent)
-
-        random.seed(seed)
-        random.shuffle(waitingList)
-        for eachEvent in waitingList:          # 2nd phase: place events in their past location's building
-            potentialLocation = getLocationsOfBuilding(self.locations, eachEvent.bldgCode)
+        notArranged = self.__allocateOverflow(arranged, self.__arrangedLocations, self.__addArrangedLocations, "AR")
+        eventCount += len(arranged) - len(notArranged)
+        phaseStart = self.stats.stopTimer("pastLocation", phaseStart)
+
+        random.Random(seed).shuffle(waitingList)
+        for i, eachEvent in enumerate(waitingList):          # 2nd phase: place events in their past location's building
+            report("pastBuilding", i, len(waitingList))
+            potentialLocation = self.getLocationsOfBuilding(eachEvent.bldgCode)
             if not potentialLocation:
                 finalList.append(eachEvent)
                 continue
-            for location in potentialLocation:
+            for location in self.__getFittingLocations(self.__getBuildingGroups(eachEvent.bldgCode), eachEvent.seats):
                 totalLoops += 1
                 if self.placeAEvent(eachEvent, location):
                     eventCount += 1
-                    finalList = [x for x in finalList if x != eachEvent]
                     break
                 else:
                     failures += 1
-                    if eachEvent not in finalList: finalList.append(eachEvent)
+            else:
+                finalList.append(eachEvent)     # no location of its building is free
+        phaseStart = self.stats.stopTimer("pastBuilding", phaseStart)
 
         # finalList = list(set(finalList))
         finalList.sort(key=lambda x: x.name)
 
-        random.seed(seed)
-        random.shuffle(finalList)
-        for eachEvent in finalList:        # 3rd phase: place events in other buildings
-            if eachEvent.dept in self.getLocationPreferences():
-                pLocations = self.getLocationPreferences()[eachEvent.dept]
-            else:
-                pLocations = []
-            potentialLocation = []
-            for bldg in pLocations:
-                potentialLocation += getLocationsOfBuilding(self.locations, bldg)
-            temp_rooms= list(set(self.locations).difference(set(potentialLocation)).difference(set(self.__arrangedLocations)))
-            temp_rooms.sort(key=lambda x: x.name)
-            potentialLocation += temp_rooms
-            for location in potentialLocation:
+        random.Random(seed).shuffle(finalList)
+        for i, eachEvent in enumerate(finalList):        # 3rd phase: place events in other buildings
+            report("otherBuildings", i, len(finalList))
+            for location in self.__getFittingLocations(self.__getCandidateGroups(eachEvent.dept), eachEvent.seats):
                 totalLoops += 1
                 if self.placeAEvent(eachEvent, location):
                     eventCount += 1
-                    unscheduled = [x for x in unscheduled if x != eachEvent]
                     break
                 else:
                     failures += 1
-                    if eachEvent not in unscheduled: unscheduled.append(eachEvent)
+            else:
+                unscheduled.append(eachEvent)
+        phaseStart = self.stats.stopTimer("otherBuildings", phaseStart)
+
+        report("unscheduled", 0, len(unscheduled))     #last phase: pack the rest into unscheduled locations
+        self.__allocateOverflow(unscheduled, self.__unscheduledLocations, self.__addUnscheduledLocations, "UN")
+        phaseStart = self.stats.stopTimer("unscheduled", phaseStart)
+
+        self.stats.count("events", len(events))
+        self.stats.count("placedInPhases", eventCount)
+        self.stats.count("failuresInPhases", failures)
+        self.stats.count("loopsInPhases", totalLoops)
+        report("metrics", 0, 1)
+        self.__getScheduleMetrics(events)
+        self.stats.stopTimer("metrics", phaseStart)
+        if improveTime > 0:
+            report("improve", 0, 1)
+            self.improveSchedule(improveTime, seed)
 
-        while len(unscheduled) != 0:        #last phase place them in unscheduled locations
-            unscheduled = self.__placeUnscheduledEvents(list(unscheduled))
+    #########################################################################
 
-        print(f"Events placed: {eventCount}/{len(events)}")
-        print(f"Total failures: {failures}")
-        print(f"Total loops: {totalLoops}")
-        self.__getScheduleMetrics(events)
+    # moves events of a finished schedule to better locations for timeBudget seconds, either by relocating an event
+    # or by swapping it with the one event that blocks it. Worse swaps are accepted with a probability that goes down
+    # over time (simulated annealing). Only the metrics of the moved events are recomputed. Returns a report of the run.
+    def improveSchedule(self, timeBudget, seed=0, temperature=1.0):
+        rng = random.Random(seed)
+        before = list(self.metrics)
+        startTime = time.time()
+        moves = accepted = 0
+        bestCost = self.__getMetricCost()
+        history = []    # (events, their locations before the move) of every move accepted after the best state seen
+        improvable = [event for event in self.events if event.placedLocation and event.metric > 1 and event.bldgCode != "AR"]
+        while improvable and time.time() - startTime < timeBudget:
+            moves += 1
+            event = rng.choice(improvable)
+            targets = self.__getBetterLocations(event)
+            if not targets:
+                improvable.remove(event)
+                continue
+            heat = temperature * (1 - (time.time() - startTime) / timeBudget)
+            moved = self.__tryMove(event, rng.choice(targets), rng, heat)
+            if moved:
+                accepted += 1
+                history.append(moved)
+                cost = self.__getMetricCost()
+                if cost < bestCost:
+                    bestCost, history = cost, []
+                for eachEvent, _ in moved:
+                    if eachEvent.metric == 1 and eachEvent in improvable:
+                        improvable.remove(eachEvent)
+                    elif eachEvent.metric > 1 and eachEvent not in improvable:
+                        improvable.append(eachEvent)
+        for moved in reversed(history):     # annealing may have wandered off the best state seen, so go back to it
+            self.__countMetrics([eachEvent for eachEvent, _ in moved], -1)
+            for eachEvent, _ in moved:
+                self.__removeEvent(eachEvent)
+            for eachEvent, location in moved:
+                self.placeAEvent(eachEvent, self.__locationsByName[location], forcePlace=True)
+            self.__countMetrics([eachEvent for eachEvent, _ in moved], 1)
+        seconds = time.time() - startTime
+        gain = sum((i + 1) * (b - a) for i, (b, a) in enumerate(zip(before, self.metrics)))     # drop of the sum of all event metrics
+        self.improvement = dict(seconds=seconds, moves=moves, accepted=accepted, before=before, after=list(self.metrics),
+                                gainPerSecond=gain / seconds if seconds > 0 else 0)
+        return self.improvement
+
+    #########################################################################
+
+    # private method that returns the weighted sum of the metric distribution, i.e. the sum of all event metrics
+    def __getMetricCost(self):
+        return sum((i + 1) * count for i, count in enumerate(self.metrics))
+
+    #########################################################################
+
+    # private method that returns the locations that would give an event a better metric than the one it has
+    def __getBetterLocations(self, event):
+        better = []
+        if event.roomNumber != "nan":
+            historical = self.getLocation(event.getHistoricalLocations()[0])
+            better += [historical] if historical is not None else []
+        if event.metric > 2 or event.roomNumber == "nan":
+            better += self.getLocationsOfBuilding(event.bldgCode)
+        if event.metric > 3:
+            for bldg in self.getLocationPreferences().get(event.dept, []):
+                better += self.getLocationsOfBuilding(bldg)
+        return [location for location in better if location.capacity >= event.seats and location.name != event.placedLocation]
+
+    #########################################################################
+
+    # private method that moves an event to a location, swapping it with the event that blocks it there if there is exactly one.
+    # The move is kept if it does not make the metrics worse (or by chance, depending on heat) and does not lower the number of
+    # events in their desiredLocation; returns the moved events paired with the locations they came from, or None
+    def __tryMove(self, event, target, rng, heat):
+        source = self.__locationsByName[event.placedLocation]
+        blockers = set()
+        for start, end in self.__getTimeIndices(event):
+            for subStart, subEnd, subBeginDay, subEndDay, subId in self.__intervalIndex[target.name].getIntervals(start, end):
+                if subBeginDay <= event.endDay and subEndDay >= event.beginDay:
+                    blockers.add(self.__idEvents[subId])
+        if len(blockers) > 1:
+            return None
+        partner = blockers.pop() if blockers else None
+        if partner is not None and (partner.bldgCode == "AR" or partner.seats > source.capacity):
+            return None
+        moved = [event] if partner is None else [event, partner]
+        oldCost = sum(eachEvent.metric for eachEvent in moved)
+        oldDesired = sum(eachEvent.metric == 1 for eachEvent in moved)
+        self.__countMetrics(moved, -1)
+        for eachEvent in moved:
+            self.__removeEvent(eachEvent)
+        if self.placeAEvent(event, target) and (partner is None or self.placeAEvent(partner, source)):
+            newMetrics = [self.__getEventMetric(eachEvent) for eachEvent in moved]
+            delta = sum(newMetrics) - oldCost
+            keepsDesired = newMetrics.count(1) >= oldDesired       # events placed in their desiredLocation are never given up
+            if keepsDesired and (delta <= 0 or (heat > 0 and rng.random() < math.exp(-delta / heat))):
+                self.__countMetrics(moved, 1)
+                return [(event, source.name)] if partner is None else [(event, source.name), (partner, target.name)]
+        for eachEvent in moved:     # undo the move
+            if eachEvent.placedLocation:
+                self.__removeEvent(eachEvent)
+        self.placeAEvent(event, source, forcePlace=True)
+        if partner is not None:
+            self.placeAEvent(partner, target, forcePlace=True)
+        self.__countMetrics(moved, 1)
+        return None
+
+    #########################################################################
+
+    # runs createSchedule once per seed on separate copies of the locations and events, spread over a process pool,
+    # and returns the best schedule along with its seed. Seeds that have not finished when timeBudget (seconds) runs out are dropped
+    # and their worker processes stopped.
+    def searchSchedule(self, events, seeds=range(8), timeBudget=None, workers=None):
+        seeds = list(seeds)
+        if not seeds:
+            raise ValueError('at least one seed has to be given')
+        workers = min(workers or os.cpu_count() or 1, len(seeds))
+        settings = (self.schTime, self.interval, self.timeGap, self.locationPreferences)
+        deadline = None if timeBudget is None else time.time() + timeBudget
+        best = None
+        if workers <= 1:     # no pool needed, run the seeds one after the other until the time is up
+            for seed in seeds:
+                if best is not None and deadline is not None and time.time() > deadline:
+                    break
+                result = runSeed(self.locations, events, settings, seed)
+                if best is None or result[0] > best[0]:
+                    best = result
+            return best[1], best[2]
+        results = queue.Queue()     # filled by the pool with the result (or the error) of each seed as soon as it is done
+        pool = multiprocessing.Pool(workers)
+        try:
+            for seed in seeds:
+                pool.apply_async(runSeed, (self.locations, events, settings, seed), callback=results.put, error_callback=results.put)
+            for seed in seeds:
+                timeout = None if deadline is None or best is None else max(deadline - time.time(), 0)
+                try:
+                    result = results.get(timeout=timeout)
+                except queue.Empty:     # out of time and there is at least one schedule
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                if best is None or result[0] > best[0]:
+                    best = result
+        finally:
+            pool.terminate()        # stops the seeds that are still waiting or running, so the time budget holds
+            pool.join()
+        return best[1], best[2]
 
     #########################################################################
 
@@ -332,98 +771,257 @@ class Schedule:
             if pastLocation[0].split(" ")[1] == "nan":          # check if historical location has a location number or not
                 waitingList.append(eachEvent)              # add them to a list to be added to schedule later
                 continue
-            if self.placeAEvent(eachEvent, searchForLocation(self.locations, pastLocation[0]), forcePlace=True):
+            locationSearch = self.getLocation(pastLocation[0])
+            if locationSearch is not None and self.placeAEvent(eachEvent, locationSearch, forcePlace=True):
                 eventCount += 1
-                print(f"Placed events: {eventCount}/{len(events)}")
             else:
                 failures += 1
         for eachEvent in waitingList:
-            pastLocation = getLocationsOfBuilding(self.locations, eachEvent.getHistoricalLocations()[0].split(" ")[0])      # try to place rooms in the same building
+            pastLocation = self.getLocationsOfBuilding(eachEvent.getHistoricalLocations()[0].split(" ")[0])      # try to place rooms in the same building
             for location in pastLocation:
                 if self.placeAEvent(eachEvent, location, forcePlace=True):
                     eventCount += 1
-                    print(f"Placed events: {eventCount}/{len(events)}")
                     break
                 else:
                     failures += 1
 
-        print("Failures: ", failures)
+        self.stats.count("placedInPhases", eventCount)
+        self.stats.count("failuresInPhases", failures)
         self.__getScheduleMetrics(events)
-        print(self.metrics)
+
+    #########################################################################
+
+    # places new events in a finished schedule without moving the events that are already placed
+    def insertEvents(self, events):
+        scheduled = set(self.events)
+        inserted = [event for event in dict.fromkeys(events) if event not in scheduled]    # events already in the schedule are skipped
+        for event in inserted:
+            self.__placeEvent(event)
+        self.events = self.events + inserted
+        self.__countMetrics(inserted, 1)
+
+    #########################################################################
+
+    # takes events out of the schedule, freeing their time slots
+    def removeEvents(self, events):
+        removed = set(events) & set(self.events)      # events that are not in the schedule (e.g. removed before) are skipped
+        for event in removed:
+            if event.placedLocation:
+                self.__removeEvent(event)
+        self.__countMetrics(removed, -1)
+        self.events = [event for event in self.events if event not in removed]
+
+    #########################################################################
+
+    # takes a location out of the schedule and places the events that were in it again; returns those events
+    def retireLocation(self, locationName):
+        location = self.__locationsByName.pop(locationName)
+        displaced = self.__getEventsInLocation(locationName)
+        self.__countMetrics(displaced, -1)
+        for event in displaced:
+            event.indices = []
+            event.placedLocation = ""
+        self.locations.remove(location)
+        self.__locationsByBuilding[locationName.split(" ")[0]].remove(location)
+        if location in self.__arrangedLocations:
+            self.__arrangedLocations.remove(location)
+        if location in self.__unscheduledLocations:
+            self.__unscheduledLocations.remove(location)
+        self.__candidateLocations = {}
+        row = self.__locationRows.pop(locationName)
+        self.__grid = np.delete(self.__grid, row, axis=0)
+        for name, eachRow in self.__locationRows.items():
+            if eachRow > row:
+                self.__locationRows[name] = eachRow - 1
+        del self.__intervalIndex[locationName]
+        for event in displaced:
+            self.__placeEvent(event)
+        self.__countMetrics(displaced, 1)
+        return displaced
+
+    #########################################################################
+
+    # private method that places one event the way createSchedule would: its arranged or past location, then its past building,
+    # then the preferred buildings of its department and the other locations, and finally a new unscheduled location
+    def __placeEvent(self, event):
+        if self.__checkAndPlaceARevents(event):
+            return True
+        if event.bldgCode != "nan":
+            if event.roomNumber != "nan":
+                location = self.getLocation(event.getHistoricalLocations()[0])
+                if location is not None and self.placeAEvent(event, location):
+                    return True
+            for location in self.__getFittingLocations(self.__getBuildingGroups(event.bldgCode), event.seats):
+                if self.placeAEvent(event, location):
+                    return True
+        for location in self.__getFittingLocations(self.__getCandidateGroups(event.dept), event.seats):
+            if self.placeAEvent(event, location):
+                return True
+        return not self.__allocateOverflow([event], self.__unscheduledLocations, self.__addUnscheduledLocations, "UN")
+
+    #########################################################################
+
+    # private method that frees the time slots of a placed event
+    def __removeEvent(self, event):
+        eventId = self.__eventIds[event]
+        index = self.__intervalIndex[event.placedLocation]
+        index.remove(eventId)
+        row = self.schedule[self.__locationRows[event.placedLocation]]
+        for start, end in event.indices:
+            block = row[start:end]
+            block[block == eventId] = 0
+            for subStart, subEnd, subBeginDay, subEndDay, subId in index.getIntervals(start, end):   # events with other dates may share the freed slots
+                block = row[max(subStart, start):min(subEnd, end)]
+                block[block == 0] = subId
+        event.indices = []
+        event.placedLocation = ""
 
     #########################################################################
 
     # gives a score of how the schedule
     def score(self):
         score = 0
-        for locationName, events in self.schedule.items():
-            for crs in set(events):
-                if crs != 0:
-                    pastLocation = crs.getHistoricalLocations()[0]
-                    if crs.placedLocation != pastLocation:       # if the location assigned is not the same as the historical location
-                        if not pastLocation.startswith("AR"):    # if event pref was AR then it always gets placed in AR, although the number is different
-                            if pastLocation.split(" ")[-1] != 'nan':  # if the csv mentioned building but not the location number for pastLocation
-                                score -= 1
-                                print(f"{crs.name} is placed at {crs.placedLocation} instead of {pastLocation}")
-                            if getDept(crs.placedLocation) != getDept(pastLocation):
-                                score -= 2
-                                print(f"{crs.name} is placed at {crs.placedLocation} instead of {pastLocation}")
+        for locationName in self.__locationRows:
+            for crs in self.__getEventsInLocation(locationName):
+                pastLocation = crs.getHistoricalLocations()[0]
+                if crs.placedLocation != pastLocation:       # if the location assigned is not the same as the historical location
+                    if not pastLocation.startswith("AR"):    # if event pref was AR then it always gets placed in AR, although the number is different
+                        if pastLocation.split(" ")[-1] != 'nan':  # if the csv mentioned building but not the location number for pastLocation
+                            score -= 1
+                        if getDept(crs.placedLocation) != getDept(pastLocation):
+                            score -= 2
         return score
 
     #########################################################################
 
+    # saves the finished schedule to a .npz file (numpy arrays, no pickles): the grid, the locations including the added
+    # AR and UN ones, the events with their placements and the settings, seed and metrics. loadSnapshot restores it
+    def saveSnapshot(self, fileName):
+        events = self.events
+        indices = [event.indices for event in events]
+        settings = dict(beginTime=self.schTime.beginTime, endTime=self.schTime.endTime, days=self.schTime.days, interval=self.interval,
+                        timeGap=self.timeGap, seed=self.seed, metrics=self.metrics, improvement=self.improvement,
+                        locationPreferences=self.locationPreferences, unscheduledLocationCount=self.__unscheduledLocationCount,
+                        arrangedLocationCount=self.__arrangedLocationCount,
+                        arrangedLocations=[location.name for location in self.__arrangedLocations],
+                        unscheduledLocations=[location.name for location in self.__unscheduledLocations])
+        np.savez(fileName, grid=self.schedule, settings=np.array(json.dumps(settings)),
+                 **{"location." + name: np.array(values) for name, values in [
+                     ("name", [location.name for location in self.locations]),
+                     ("capacity", np.array([location.capacity for location in self.locations], dtype=np.int64)),
+                     ("features", ["/".join(features) if isinstance(features, list) else str(features)
+                                   for features in (location.locationFeatures for location in self.locations)]),
+                     ("building", [location.building for location in self.locations])]},
+                 **{"event." + name: np.array(values) for name, values in [
+                     ("code", [event.eventCode for event in events]), ("name", [event.name for event in events]),
+                     ("seats", [event.seats for event in events]), ("capacity", [event.capacity for event in events]),
+                     ("maxCapacity", [event.maxCapacity for event in events]), ("beginTime", [event.time.beginTime for event in events]),
+                     ("endTime", [event.time.endTime for event in events]), ("days", [",".join(event.time.days) for event in events]),
+                     ("beginMinutes", [event.time.beginMinutes for event in events]), ("endMinutes", [event.time.endMinutes for event in events]),
+                     ("pastLocation", [event.getHistoricalLocations()[0] for event in events]), ("beginDate", [event.beginDate for event in events]),
+                     ("endDate", [event.endDate for event in events]), ("dept", [event.dept for event in events]),
+                     ("beginDay", [event.beginDay for event in events]), ("endDay", [event.endDay for event in events]),
+                     ("id", [self.__eventIds.get(event, 0) for event in events]),
+                     ("placedLocation", [event.placedLocation for event in events]), ("metric", [event.metric for event in events]),
+                     ("indexCount", [len(eventIndices) for eventIndices in indices]),
+                     ("starts", np.array([start for eventIndices in indices for start, end in eventIndices], dtype=np.int64)),
+                     ("ends", np.array([end for eventIndices in indices for start, end in eventIndices], dtype=np.int64))]})
+
+    #########################################################################
+
+    # puts the grid and the placements read by loadSnapshot back into this schedule, which has the saved locations but
+    # no events yet; the interval indexes are rebuilt from the placements. Ids of events removed before saving stay free (0)
+    def restoreSnapshot(self, events, grid, eventIds, placedLocations, metrics, indices, settings):
+        self.__grid = np.array(grid)
+        self.__idEvents = [0] * (max(eventIds, default=0) + 1)
+        for event, eventId, placedLocation, metric, eventIndices in zip(events, eventIds, placedLocations, metrics, indices):
+            event.placedLocation = placedLocation
+            event.metric = metric
+            event.indices = eventIndices
+            if eventId:
+                self.__eventIds[event] = eventId
+                self.__idEvents[eventId] = event
+            if eventId and placedLocation:
+                for start, end in eventIndices:
+                    self.__intervalIndex[placedLocation].add(start, end, event.beginDay, event.endDay, eventId)
+        self.events = events
+        self.seed = settings["seed"]
+        self.metrics = settings["metrics"]
+        self.improvement = settings["improvement"]
+        self.locationPreferences = settings["locationPreferences"]
+        self.__unscheduledLocationCount = settings["unscheduledLocationCount"]
+        self.__arrangedLocationCount = settings["arrangedLocationCount"]
+        self.__arrangedLocations = [self.__locationsByName[name] for name in settings["arrangedLocations"]]
+        self.__unscheduledLocations = [self.__locationsByName[name] for name in settings["unscheduledLocations"]]
+        self.__candidateLocations = {}
+
+    #########################################################################
+
     # exports the schedule to a csv file
     def exportToCSV(self, allEvents):
-        df = []
-        for eachEvent in allEvents:
-            df.append(dict(Code=eachEvent.eventCode, Event=eachEvent.name, Days=eachEvent.time.days,
-                           Time=eachEvent.time.totalTime, Event_Enrollment = eachEvent.seats, Event_Capacity=eachEvent.capacity,
-                           Event_Max_Enrollment=eachEvent.maxCapacity,  PastLocation= eachEvent.getHistoricalLocations(), Location=eachEvent.placedLocation, Metric = eachEvent.metric))
-        df = pd.DataFrame(df)
+        df = pd.DataFrame(list(self.exportRows(allEvents)))
         df.sort_values(df.columns[0],inplace=True)
         return df.to_csv
 
     #########################################################################
 
-    # gives the metrics of the schedule
+    # yields one dictionary per event with the columns of the exported csv file
+    def exportRows(self, allEvents):
+        for eachEvent in allEvents:
+            yield dict(Code=eachEvent.eventCode, Event=eachEvent.name, Days=eachEvent.time.days,
+                       Time=eachEvent.time.totalTime, Event_Enrollment = eachEvent.seats, Event_Capacity=eachEvent.capacity,
+                       Event_Max_Enrollment=eachEvent.maxCapacity,  PastLocation= eachEvent.getHistoricalLocations(), Location=eachEvent.placedLocation, Metric = eachEvent.metric)
+
+    #########################################################################
+
+    # gives the metrics of the schedule: the number of events placed in the desired location, the same building,
+    # a building from the location preferences and an unpreferred location
     def __getScheduleMetrics(self, allEvents):
-        desiredLocation = 0
-        sameBuilding = 0
-        adjBuilding = 0
-        wrongBuilding = 0
+        self.metrics = [0, 0, 0, 0]
         for event in allEvents:
-            if event.bldgCode == 'nan':      # if there is no desiredLocation then we are free to put it anywhere
-                desiredLocation += 1
-                event.metric = 1
-            elif event.bldgCode == event.placedLocation.split(' ')[0] and event.roomNumber == event.placedLocation.split(' ')[1]:   # if same building and room then increment desiredLocation
-                desiredLocation += 1
-                event.metric = 1
-            elif event.bldgCode == event.placedLocation.split(' ')[0] and event.roomNumber == 'nan':      # if same building but no room specified, then also increment desiredLocation
-                desiredLocation += 1
-                event.metric = 1
-            elif event.bldgCode == event.placedLocation.split(' ')[0] and event.roomNumber != event.placedLocation.split(' ')[1]:   # if same building but different room then increment sameBuilding
-                sameBuilding += 1
-                event.metric = 2
-            elif event.dept in self.getLocationPreferences():
-                if event.placedLocation.split(' ')[0] in self.getLocationPreferences()[event.dept]:       # if placed building is in location preferences then increment adjBuilding
-                    adjBuilding += 1
-                    event.metric =3
-                else:
-                    wrongBuilding += 1
-                    event.metric = 4
-            else:
-                wrongBuilding += 1
-                event.metric = 4
-        self.metrics = [desiredLocation, sameBuilding, adjBuilding, wrongBuilding]
+            event.metric = self.__getEventMetric(event)
+            self.metrics[event.metric - 1] += 1
 
+    #########################################################################
+
+    # private method that gives the metric of the location an event is placed in (1 = desired location ... 4 = unpreferred location)
+    def __getEventMetric(self, event):
+        placedBuilding = event.placedLocation.split(' ')[0]
+        if event.bldgCode == 'nan':      # if there is no desiredLocation then we are free to put it anywhere
+            return 1
+        elif event.bldgCode == placedBuilding and event.roomNumber == event.placedLocation.split(' ')[1]:   # if same building and room then it is the desiredLocation
+            return 1
+        elif event.bldgCode == placedBuilding and event.roomNumber == 'nan':      # if same building but no room specified, then it is also the desiredLocation
+            return 1
+        elif event.bldgCode == placedBuilding:   # if same building but different room
+            return 2
+        elif placedBuilding in self.getLocationPreferences().get(event.dept, []):       # if placed building is in location preferences
+            return 3
+        return 4
 
+    #########################################################################
 
-    # adds unscheduled locations in the schedule
+    # private method that updates the metrics of the schedule after events were placed or removed (sign = 1 or -1)
+    def __countMetrics(self, events, sign):
+        if not self.metrics:
+            self.metrics = [0, 0, 0, 0]
+        for event in events:
+            if sign > 0:
+                event.metric = self.__getEventMetric(event)
+            self.metrics[event.metric - 1] += sign
+
+
+
+    # adds unscheduled locations in the schedule and returns the new location
     def __addUnscheduledLocations(self):
         newLocation = 'UN ' + str(self.__unscheduledLocationCount)
-        self.locations.append(Location(newLocation, 500, "Desks/Tables/Chairs/TV/Podium/White Board Projector"))
-        self.schedule[newLocation] = [0 for _ in range(self.weekInterval)]
+        location = Location(newLocation, 500, "Desks/Tables/Chairs/TV/Podium/White Board Projector")
+        self.locations.append(location)
+        self.__indexLocation(location)
         self.__unscheduledLocationCount += 1
+        self.__unscheduledLocations.append(location)
+        self.stats.count("roomsCreated.UN")
+        return location
 
     #########################################################################
 
@@ -432,20 +1030,37 @@ class Schedule:
         newLocation = 'AR ' + str(self.__arrangedLocationCount)
         location = Location(newLocation, 500, "")
         self.locations.append(location)
-        self.schedule[newLocation] = [0 for _ in range(self.weekInterval)]
+        self.__indexLocation(location)
         self.__arrangedLocationCount += 1
         self.__arrangedLocations.append(location)
+        self.stats.count("roomsCreated.AR")
+        return location
 
     #########################################################################
 
-    # adds unscheduled classes in unscheduled locations, and if adds new unscheduled locations if it is filled
-    def __placeUnscheduledEvents(self, events):
-        self.__addUnscheduledLocations()
-        for event in events:
-            if self.placeAEvent(event, self.locations[-1]):
-                events.remove(event)
-                print(f"{event.name} placed at {self.locations[-1].name}")
-        return events
+    # private method that packs events into overflow locations (the AR or UN ones in rooms). The events are sorted by their
+    # first time slot and each one goes into the first location it fits in; addRoom() adds a new location only when none
+    # fits. For events that take one time block (an interval graph) this needs the least possible number of locations,
+    # the clique lower bound of the events is recorded in stats as lowerBound.<kind>. Returns the events that can not
+    # be placed in any location, i.e. the ones outside the day of the schedule
+    def __allocateOverflow(self, events, rooms, addRoom, kind):
+        placeable = [event for event in events
+                     if self.schTime.beginMinutes <= event.time.beginMinutes and event.time.endMinutes <= self.schTime.endMinutes]
+        if not placeable:
+            return list(events)
+        gap = max(self.timeGap // self.interval, 0)
+        intervals = [(start, getGapWindow(start, end, gap, self.dayInterval)[1], event.beginDay, event.endDay)
+                     for event in placeable for start, end in self.__getTimeIndices(event)]
+        self.stats.count("lowerBound." + kind, getMaxDepth(intervals))
+        firstSlot = lambda event: min((start for start, end in self.__getTimeIndices(event)), default=0)
+        for event in sorted(placeable, key=firstSlot):
+            for location in rooms:
+                if self.placeAEvent(event, location):
+                    break
+            else:
+                self.placeAEvent(event, addRoom(), forcePlace=True)     # an empty location only needs to be big enough
+        placed = set(placeable)
+        return [event for event in events if event not in placed]
 
     #########################################################################
 
@@ -453,26 +1068,138 @@ class Schedule:
     def __checkAndPlaceARevents(self, event):
         pastLocation = event.getHistoricalLocations()[0]
         if pastLocation.split(" ")[0] == "AR":
-            if self.placeAEvent(event, searchForLocation(self.locations, pastLocation)):
-                return True
-            for location in self.__arrangedLocations:
-                if self.placeAEvent(event, location):
-                    return True
-            self.__addArrangedLocations()
-            if self.placeAEvent(event, self.locations[-1]):
+            location = self.getLocation(pastLocation)
+            if location is not None and self.placeAEvent(event, location):
                 return True
+            return not self.__allocateOverflow([event], self.__arrangedLocations, self.__addArrangedLocations, "AR")
         return False
 
     #########################################################################
 
-    # returns the schedule in the form of a 2D array(list)
+    # returns the schedule in the form of a dictionary of location names to lists of events (0 = free)
     def printSchedule(self):
-        return self.schedule
+        idEvents = np.empty(len(self.__idEvents), dtype=object)
+        idEvents[:] = self.__idEvents
+        return {name: idEvents[self.schedule[row]].tolist() for name, row in self.__locationRows.items()}
 
     #########################################################################
 
 
 
+# creates a schedule for one seed of Schedule.searchSchedule and returns (rank, schedule, seed), where a higher rank is a better schedule.
+# Works on copies because createSchedule updates the events and adds locations in place.
+def runSeed(locations, events, settings, seed):
+    locations, events = copy.deepcopy((locations, events))
+    schTime, interval, timeGap, locationPreferences = settings
+    schedule = Schedule(locations, time=schTime, interval=interval, timeGap=timeGap)
+    schedule.locationPreferences = locationPreferences
+    schedule.createSchedule(events, seed)
+    return (schedule.score(), *schedule.metrics[:3]), schedule, seed
+
+
+############################################################
+################# SCHEDULESTATS class ######################
+############################################################
+
+# Timers and counters of a schedule: the seconds spent per phase, the placement attempts, the rejections by reason
+# (rejected.capacity, rejected.timeGap, rejected.slotConflict, rejected.outOfWindow) and the rooms created (roomsCreated.AR/UN).
+# When disabled nothing is recorded.
+class ScheduleStats:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    #########################################################################
+
+    # clears the timers and counters
+    def reset(self):
+        self.timers = {}  # phase -> seconds
+        self.counters = {}  # name -> count
+
+    #########################################################################
+
+    # adds amount to a counter
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    #########################################################################
+
+    # adds the time since start (from time.perf_counter) to the timer of a phase and returns the current time
+    def stopTimer(self, phase, start):
+        now = time.perf_counter()
+        if self.enabled:
+            self.timers[phase] = self.timers.get(phase, 0) + now - start
+        return now
+
+    #########################################################################
+
+    # adds the timers and counters of another ScheduleStats to these ones
+    def merge(self, other):
+        for phase, seconds in other.timers.items():
+            self.timers[phase] = self.timers.get(phase, 0) + seconds
+        for name, amount in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    #########################################################################
+
+    def info(self):
+        return dict(timers=dict(self.timers), counters=dict(self.counters))
+
+
+############################################################
+################# INTERVALINDEX class ######################
+############################################################
+
+# Keeps the (slot range, date range) intervals of the events placed in one location sorted by their starting slot,
+# so that an overlap query only looks at the intervals that can reach the queried slots
+class IntervalIndex:
+    def __init__(self):
+        self.starts = []  # starting slots, sorted
+        self.intervals = []  # (start, end, beginDay, endDay, eventId) in the same order as starts
+        self.maxLength = 0  # length of the longest interval, bounds how far back an overlapping interval can start
+
+    #########################################################################
+
+    # adds the interval [start, end) of an event that runs from beginDay to endDay
+    def add(self, start, end, beginDay, endDay, eventId):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.intervals.insert(i, (start, end, beginDay, endDay, eventId))
+        self.maxLength = max(self.maxLength, end - start)
+
+    #########################################################################
+
+    # removes the intervals of an event
+    def remove(self, eventId):
+        kept = [i for i, interval in enumerate(self.intervals) if interval[4] != eventId]
+        self.starts = [self.starts[i] for i in kept]
+        self.intervals = [self.intervals[i] for i in kept]
+
+    #########################################################################
+
+    # returns the intervals that share a slot with [start, end), whatever their dates are
+    def getIntervals(self, start, end):
+        lo = bisect.bisect_right(self.starts, start - self.maxLength)
+        hi = bisect.bisect_left(self.starts, end)
+        return [interval for interval in self.intervals[lo:hi] if interval[1] > start]
+
+    #########################################################################
+
+    # checks if any interval shares a slot in [start, end) and a day in [beginDay, endDay]
+    def overlaps(self, start, end, beginDay, endDay):
+        for subStart, subEnd, subBeginDay, subEndDay, subId in self.getIntervals(start, end):
+            if subBeginDay <= endDay and subEndDay >= beginDay:
+                return True
+        return False
+
+    #########################################################################
+
+    # returns the ids of the events in the index
+    def getEventIds(self):
+        return list(dict.fromkeys(interval[4] for interval in self.intervals))
+
+
 ############################################################
 ################# CONSTRAINTERROR class ####################
 ############################################################
@@ -500,30 +1227,204 @@ class DistanceMatrix:
 
 
 
+# Columns of the two layouts of the event file (crs_* registrar extracts and event_* files), keyed by the event table column they fill
+eventFileColumns = {
+    "crs": dict(code="crs_cde", name="crs_title", seats="crs_enrollment", capacity="crs_capacity", maxCapacity="max_enrollment",
+                beginTime="begin_tim", endTime="end_tim", beginDate="begin_dte", endDate="end_dte", bldg="bldg_cde", room="room_cde"),
+    "event": dict(code="event_cde", name="event_title", seats="event_enrollment", capacity="event_capacity", maxCapacity="max_enrollment",
+                  beginTime="begin_time", endTime="end_time", beginDate="begin_date", endDate="end_date", bldg="bldg_cde", room="room_cde"),
+}
+dayColumns = ['monday_cde', 'tuesday_cde', 'wednesday_cde', 'thursday_cde', 'friday_cde']
+locationFileColumns = ['Location', 'Capacity', 'Features']
+
+# Columns of the event table, in the order of the arguments of Event
+eventTableColumns = ['code', 'name', 'seats', 'capacity', 'maxCapacity', 'beginTime', 'endTime', 'days', 'beginMinutes', 'endMinutes',
+                     'pastLocation', 'beginDate', 'endDate', 'dept', 'beginDay', 'endDay']
+
+
+# Returns the columns of the event file layout used by a file with the given header
+def getEventFileColumns(header, courseFlag=False):
+    if ("crs_cde" in header) or (courseFlag and "event_cde" not in header):
+        return eventFileColumns["crs"]
+    return eventFileColumns["event"]
+
+
+# Reads the event file into a table with one row per event and the times, dates, departments and days already parsed
+def loadEventTable(fileName, courseFlag=False):
+    usedColumns = set(dayColumns).union(*[layout.values() for layout in eventFileColumns.values()])
+    eventDataset = pd.read_csv(fileName, dtype=str, usecols=lambda column: column in usedColumns)
+    columns = getEventFileColumns(eventDataset.columns, courseFlag)
+    beginTime = eventDataset[columns['beginTime']].str.extract(r"(\d?\d:\d\d)", expand=False)   # same as getTime
+    endTime = eventDataset[columns['endTime']].str.extract(r"(\d?\d:\d\d)", expand=False)
+    hasTime = (beginTime.notna() & endTime.notna()).values  # dropping the events which do not have allocated times since they are internships, independent studies etc
+    eventDataset, beginTime, endTime = eventDataset[hasTime], beginTime[hasTime], endTime[hasTime]
+
+    days = pd.Series("", index=eventDataset.index)
+    for column in dayColumns:       # joins the day codes of a row into "M,W,F", leaving out the empty ones like removeNans
+        day = eventDataset[column].fillna("").str.strip()       # stripped like in checkEventChunk, so " M" is read as M
+        days = days + day.str.cat(np.where(day != "", ",", ""))
+    beginDate = eventDataset[columns['beginDate']].fillna("nan").str.split(" ").str[0]
+    endDate = eventDataset[columns['endDate']].fillna("nan").str.split(" ").str[0]
+    code = eventDataset[columns['code']].fillna("")
+    return pd.DataFrame({
+        'code': code,
+        'name': eventDataset[columns['name']].fillna(""),
+        'seats': toNumbers(eventDataset[columns['seats']]),
+        'capacity': toNumbers(eventDataset[columns['capacity']]),
+        'maxCapacity': toNumbers(eventDataset[columns['maxCapacity']]),
+        'beginTime': beginTime,
+        'endTime': endTime,
+        'days': days.str.rstrip(",").astype("category"),
+        'beginMinutes': toMinuteColumn(beginTime),
+        'endMinutes': toMinuteColumn(endTime),
+        'pastLocation': eventDataset[columns['bldg']].str.strip().fillna("nan") + " " + eventDataset[columns['room']].str.strip().fillna("nan"),
+        'beginDate': beginDate,
+        'endDate': endDate,
+        'dept': code.str.extract("([A-Z]+)", expand=False).fillna("").astype("category"),   # same as getDept
+        'beginDay': toDayOrdinals(beginDate, datetime.date.min.toordinal()),
+        'endDay': toDayOrdinals(endDate, datetime.date.max.toordinal()),
+    }).reset_index(drop=True)
+
+
+# Creates the Event objects of the rows of an event table
+def eventsFromTable(eventTable):
+    times = {}      # (beginTime, endTime, days) -> Time shared by the events with those times
+
+    def getTime(beginTime, endTime, days, beginMinutes, endMinutes):
+        key = (beginTime, endTime, days)
+        if key not in times:
+            times[key] = Time(beginTime, endTime, days.split(",") if days else [], beginMinutes, endMinutes)
+        return times[key]
+
+    return [Event(code, name, seats, capacity, maxCapacity, getTime(beginTime, endTime, days, beginMinutes, endMinutes),
+                  pastLocation, beginDate, endDate, dept, beginDay, endDay)
+            for code, name, seats, capacity, maxCapacity, beginTime, endTime, days, beginMinutes, endMinutes, pastLocation, beginDate, endDate, dept, beginDay, endDay
+            in zip(*[eventTable[column].tolist() for column in eventTableColumns])]
+
+
 # Returns a list of Event objects of all the events present in the file.
 def getAllEvents(fileName, courseFlag=False):
-    eventDataset = pd.read_csv(fileName)
-    if ("crs_cde" in eventDataset.columns) or courseFlag:
-        eventDataset = eventDataset.dropna(subset=['begin_tim', 'end_tim'])
-        return [Event(data['crs_cde'], data['crs_title'], data['crs_enrollment'], data['crs_capacity'],    # creates a Event object of each event in the dataset and adds it to the list
-            data['max_enrollment'], Time(getTime(data['begin_tim']), getTime(data['end_tim']),  # create a Time object
-                 [data['monday_cde'], data['tuesday_cde'], data['wednesday_cde'], data['thursday_cde'], data['friday_cde']]), str(data['bldg_cde']) + " " + str(data['room_cde']),
-                   data['begin_dte'], data['end_dte']) for index, data in eventDataset.iterrows()]
-    else:
-        eventDataset = eventDataset.dropna(subset=['begin_time', 'end_time'])  # dropping the events which do not have allocated times since they are internships, independent studies etc
-        return [Event(data['event_cde'], data['event_title'], data['event_enrollment'], data['event_capacity'],    # creates a Event object of each event in the dataset and adds it to the list
-            data['max_enrollment'], Time(getTime(data['begin_time']), getTime(data['end_time']),  # create a Time object
-                 [data['monday_cde'], data['tuesday_cde'], data['wednesday_cde'], data['thursday_cde'], data['friday_cde']]), str(data['bldg_cde']) + " " + str(data['room_cde']),
-                   data['begin_date'], data['end_date']) for index, data in eventDataset.iterrows()]
+    return eventsFromTable(loadEventTable(fileName, courseFlag))
+
+
+# Reads the location file into a table with one row per location, sorted by name
+def loadLocationTable(fileName):
+    locationDataset = pd.read_csv(fileName, dtype={'Location': str, 'Features': str})
+    locationDataset = locationDataset.sort_values('Location')
+    name = locationDataset['Location'].fillna("nan")
+    return pd.DataFrame({
+        'name': name,
+        'capacity': toNumbers(locationDataset['Capacity']),
+        'features': locationDataset['Features'].fillna("nan"),
+        'building': name.str.extract("([A-Z]+)", expand=False).fillna(""),   # same as getDept
+    }).reset_index(drop=True)
+
+
+# Creates the Location objects of the rows of a location table; splitAColumn separates the furnishings in the location in a list for easier access
+def locationsFromTable(locationTable):
+    return [Location(name, capacity, splitAColumn(features, "/"), building)
+            for name, capacity, features, building in zip(*[locationTable[column].tolist() for column in ['name', 'capacity', 'features', 'building']])]
 
 
 # Returns a list of Location objects of all the locations present in the file
 def getAllLocations(fileName):
-    locationDataset = pd.read_csv(fileName)
-    locationDataset = locationDataset.sort_values('Location')
-    return [Location(rms['Location'], rms['Capacity'], splitAColumn(rms['Features'], "/"))
-            for index, rms in locationDataset.iterrows()]
-    # creates a Location object for each location present in the file; splitAColumn separates the furnishings in the location in a list for easier access
+    return locationsFromTable(loadLocationTable(fileName))
+
+# Reads a schedule saved with Schedule.saveSnapshot; the schedule and its events (schedule.events) are ready for
+# exports, figures and incremental edits without running createSchedule again
+def loadSnapshot(fileName):
+    with np.load(fileName, allow_pickle=False) as snapshot:
+        settings = json.loads(str(snapshot["settings"]))
+        locationTable = pd.DataFrame({column: snapshot["location." + column] for column in ['name', 'capacity', 'features', 'building']})
+        schedule = Schedule(locationsFromTable(locationTable), time=Time(settings["beginTime"], settings["endTime"], settings["days"]),
+                            interval=settings["interval"], timeGap=settings["timeGap"])
+        events = eventsFromTable(pd.DataFrame({column: snapshot["event." + column] for column in eventTableColumns}))
+        bounds = np.cumsum(np.concatenate([[0], snapshot["event.indexCount"]])).tolist()
+        starts, ends = snapshot["event.starts"].tolist(), snapshot["event.ends"].tolist()
+        indices = [list(zip(starts[begin:end], ends[begin:end])) for begin, end in zip(bounds[:-1], bounds[1:])]
+        schedule.restoreSnapshot(events, snapshot["grid"], snapshot["event.id"].tolist(), snapshot["event.placedLocation"].tolist(),
+                                 snapshot["event.metric"].tolist(), indices, settings)
+    return schedule
+
+
+# Compares two schedules saved with Schedule.saveSnapshot, see Schedule.compareSchedule
+def compareSnapshots(beforeFile, afterFile):
+    return loadSnapshot(beforeFile).compareSchedule(loadSnapshot(afterFile))
+
+
+dayCodes = ['M', 'T', 'W', 'R', 'F', 'Sa', 'Su']
+
+
+# Checks an event file chunk by chunk, so that a large file is never held in memory at once. The header is checked
+# first, then every chunk gets vectorized checks of the times, dates, numbers, day codes and building codes.
+# Returns at most maxErrors messages with the line of the problem; an empty list means that the file can be loaded
+def validateEventTable(fileName, courseFlag=False, chunkSize=10000, maxErrors=50):
+    errors = []
+    try:
+        for chunk in pd.read_csv(fileName, dtype=str, chunksize=chunkSize):
+            columns = getEventFileColumns(chunk.columns, courseFlag)
+            missing = [column for column in list(columns.values()) + dayColumns if column not in chunk.columns]
+            if missing:
+                return ["missing columns: " + ", ".join(missing)]
+            checkEventChunk(chunk, columns, errors, maxErrors)
+            if len(errors) >= maxErrors:
+                break
+    except (ValueError, UnicodeDecodeError) as error:     # pandas parser errors are ValueErrors
+        return ["the file can not be read as csv: " + str(error)]
+    return errors
+
+
+# adds the checks of one chunk of an event file to errors
+def checkEventChunk(chunk, columns, errors, maxErrors):
+    beginText, endText = chunk[columns['beginTime']], chunk[columns['endTime']]
+    beginTime = beginText.str.extract(r"(\d?\d):(\d\d)").astype(float)     # same pattern as loadEventTable
+    endTime = endText.str.extract(r"(\d?\d):(\d\d)").astype(float)
+    for name, text, parts in [(columns['beginTime'], beginText, beginTime), (columns['endTime'], endText, endTime)]:
+        addRowErrors(errors, isGiven(text) & parts[0].isna(), text, name + " {!r} is not a time of the form H:MM", maxErrors)
+        addRowErrors(errors, (parts[0] > 24) | (parts[1] > 59), text, name + " {!r} is not a time of the day", maxErrors)
+    oneTime = isGiven(beginText) != isGiven(endText)
+    addRowErrors(errors, oneTime, beginText.fillna(endText), "only one of the times is given: {!r}", maxErrors)
+    beginMinutes, endMinutes = 60 * beginTime[0] + beginTime[1], 60 * endTime[0] + endTime[1]
+    addRowErrors(errors, endMinutes <= beginMinutes, endText, "end time {!r} is not after the begin time", maxErrors)
+
+    beginDays = {}
+    for key in ['beginDate', 'endDate']:
+        dates = chunk[columns[key]].str.split(" ").str[0]      # the time part is left out like in loadEventTable
+        beginDays[key] = pd.Series(toDayOrdinals(dates, -1), index=chunk.index)
+        addRowErrors(errors, isGiven(dates) & (beginDays[key] == -1), dates, columns[key] + " {!r} is not a date of the form YYYY-MM-DD or MM/DD/YYYY", maxErrors)
+    endsFirst = (beginDays['beginDate'] != -1) & (beginDays['endDate'] != -1) & (beginDays['endDate'] < beginDays['beginDate'])
+    addRowErrors(errors, endsFirst, chunk[columns['endDate']], "end date {!r} is before the begin date", maxErrors)
+
+    for key in ['seats', 'capacity', 'maxCapacity']:
+        numbers = chunk[columns[key]]
+        addRowErrors(errors, isGiven(numbers) & pd.to_numeric(numbers, errors="coerce").isna(), numbers, columns[key] + " {!r} is not a number", maxErrors)
+    for column in dayColumns:
+        days = chunk[column].str.strip()
+        addRowErrors(errors, isGiven(days) & ~days.isin(dayCodes), days, column + " {!r} is not one of " + "/".join(dayCodes), maxErrors)
+    buildings = chunk[columns['bldg']].str.strip()
+    addRowErrors(errors, isGiven(buildings) & ~buildings.str.fullmatch(r"[A-Z]+").fillna(False).astype(bool), buildings,
+                 columns['bldg'] + " {!r} is not a building code of capital letters", maxErrors)
+
+
+# Checks a location file chunk by chunk like validateEventTable: the names need a building code and the capacities
+# have to be numbers
+def validateLocationTable(fileName, chunkSize=10000, maxErrors=50):
+    errors = []
+    try:
+        for chunk in pd.read_csv(fileName, dtype=str, chunksize=chunkSize):
+            missing = [column for column in locationFileColumns if column not in chunk.columns]
+            if missing:
+                return ["missing columns: " + ", ".join(missing)]
+            names, capacities = chunk['Location'], chunk['Capacity']
+            addRowErrors(errors, ~names.str.match(r"\s*[A-Z]+").fillna(False).astype(bool), names, "Location {!r} does not start with a building code", maxErrors)
+            numbers = pd.to_numeric(capacities, errors="coerce")
+            addRowErrors(errors, numbers.isna() | (numbers < 0), capacities, "Capacity {!r} is not a number of seats", maxErrors)
+            if len(errors) >= maxErrors:
+                break
+    except (ValueError, UnicodeDecodeError) as error:
+        return ["the file can not be read as csv: " + str(error)]
+    return errors
+
 
 ############################################################
 #################### HELPER FUNCTIONS ######################
@@ -543,26 +1444,75 @@ toDateTime = lambda time: datetime.timedelta(hours=int(time.split(":")[0]), minu
 # Converts pure date strings of the form YYYY-MM-DD to dateTime objects
 toDate = lambda date: datetime.date(year=int(date.split('-')[0]), month=int(date.split('-')[1]), day=int(date.split('-')[2]))
 
+# converts a column of ..:.. time strings to the minutes since midnight
+def toMinuteColumn(times):
+    parts = times.str.split(":", expand=True)
+    return (60 * parts[0].astype(np.int64) + parts[1].astype(np.int64)).values
+
+# converts a column of numbers read as text to integers, missing or unreadable numbers become 0
+toNumbers = lambda column: pd.to_numeric(column, errors="coerce").fillna(0).astype(np.int64).values
+
+# converts a column of date strings of the form YYYY-MM-DD or MM/DD/YYYY to day ordinals; missing or unreadable dates get default
+def toDayOrdinals(dates, default):
+    parsed = pd.to_datetime(dates, format="%Y-%m-%d", errors="coerce")
+    parsed = parsed.fillna(pd.to_datetime(dates, format="%m/%d/%Y", errors="coerce"))
+    ordinals = parsed.values.astype("datetime64[D]").astype(np.int64) + datetime.date(1970, 1, 1).toordinal()
+    return np.where(parsed.isna().values, default, ordinals)
+
+# returns which values of a text column are neither missing nor blank
+isGiven = lambda column: column.fillna("").str.strip() != ""
+
+# adds a message for every row where invalid is True until there are maxErrors messages; the message is formatted with
+# the value of the row and the line is counted in the file (the header is line 1)
+def addRowErrors(errors, invalid, values, message, maxErrors):
+    invalid = invalid.fillna(False).astype(bool)
+    for line, value in zip(values.index[invalid.values][:max(maxErrors - len(errors), 0)], values[invalid.values]):
+        errors.append(f"line {line + 2}: " + message.format(value))
+
+# converts a date string of the form YYYY-MM-DD or MM/DD/YYYY to a day ordinal; returns default if the date is missing
+def toDayOrdinal(date, default):
+    if date in ("nan", "NaT", "None", ""):
+        return default
+    if "/" in date:
+        month, day, year = date.split("/")
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    return toDate(date).toordinal()
+
 # Takes in two times as strings in the format ..:.. and returns the difference as a datetime object
 def subtractTime(start, end):
     t1 = toDateTime(start)
     t2 = toDateTime(end)
     return t2 - t1
 
-# checks if there are any events near an indices for the time gap that the user inputted
-def checkTimeGap(locationIndices, start, end, timeInterval, timeGap):
-    decrements = start - 1
-    increments = end
-    interval = timeInterval
-    while interval <= timeGap:
-        if isinstance(locationIndices[decrements], Event) or (isinstance(locationIndices[increments], Event)):
-            return True
-        interval += timeInterval
-        decrements -= 1
-        increments += 1
-    return False
+# returns the slots [lo, hi) that have to be free of events for an event in [start, end): gap slots (the time gap that the
+# user inputted) on each side, clipped to the day of the event so that the gap never reaches into the previous or next day
+def getGapWindow(start, end, gap, dayInterval):
+    dayStart = start - start % dayInterval
+    return max(start - gap, dayStart), min(end + gap, dayStart + dayInterval)
+
 
 
+# returns the capacities and the locations of a list sorted by capacity (ties keep their order), for bisect
+def sortByCapacity(locations):
+    locations = sorted(locations, key=lambda location: location.capacity)
+    return [location.capacity for location in locations], locations
+
+# returns the largest number of (start, end, beginDay, endDay) intervals that share a slot and a day, i.e. the largest
+# clique of the events. The largest overlap is always on a day where an interval begins, so for each of those days
+# the intervals running on it are swept over the slots with a cumulative sum
+def getMaxDepth(intervals):
+    if not intervals:
+        return 0
+    starts, ends, beginDays, endDays = (np.array(column, dtype=np.int64) for column in zip(*intervals))
+    maxDepth = 0
+    for day in np.unique(beginDays):
+        active = (beginDays <= day) & (endDays >= day)
+        slots = np.concatenate([ends[active], starts[active]])
+        changes = np.repeat([-1, 1], active.sum())
+        order = np.lexsort((changes, slots))    # intervals end before others start in the same slot
+        maxDepth = max(maxDepth, int(np.cumsum(changes[order]).max()))
+    return maxDepth
+
 
 # takes in a time:String as a parameter and returns an index that can be put in the time list
 def getIndex(time):
@@ -570,6 +1520,9 @@ def getIndex(time):
     index = 60 * int(temp[0]) + int(temp[1])
     return index
 
+# converts minutes since midnight to a time:string of the form ..:..
+minutesToTime = lambda minutes: f"{minutes // 60}:{minutes % 60:02d}"
+
 # returns a list of times in string that represent the schedule week
 def getTimeRange(schedule):
     timeRange = [str(x) + ":00" for x in range(int(schedule.schTime.beginTime.split(":")[0]), int(schedule.schTime.endTime.split(":")[0]))]
@@ -583,16 +1536,21 @@ def getDept(eventCode):
 
 # searches for the specified locationName in the list of location objects and returns it
 def searchForLocation(allLocations, locationName):
-    if locationName.split(" ")[1] == "00" or locationName.split(" ")[1]=="000":
-        locationName = locationName.split(" ")[0] + " " + "0"
-    locationName = locationName.split(".")[0]
+    locationName = normalizeLocationName(locationName)
     for location in allLocations:
         if location.name == locationName:
             return location
 
 # returns a list of locations of the building specified
 def getLocationsOfBuilding(allLocations, bldg):
-    return [location for location in allLocations if location.name.startswith(bldg)]
+    return [location for location in allLocations if location.name.split(" ")[0] == bldg]
+
+# normalizes a location name read from a file (e.g. "BA 10.0" -> "BA 10", "BA 000" -> "BA 0") to match the location list
+def normalizeLocationName(locationName):
+    parts = locationName.split(" ")
+    if len(parts) > 1 and parts[1] in ("00", "000"):
+        locationName = parts[0] + " " + "0"
+    return locationName.split(".")[0]
 
 ############################################################
 ###################### MAIN function #######################
@@ -1,6 +1,8 @@
 # Import required library files
-import dash, base64, pandas as pd, io, copy
-import datetime, json, random, time
+import dash, base64, pandas as pd, io, copy, flask
+import datetime, json, random, time, hashlib, threading, uuid, os
+from concurrent import futures
+from collections import OrderedDict
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 from base64 import b64encode
@@ -17,6 +19,183 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])
 app.title = "Event Placer"
 server = app.server
 
+# Keeps the most recently used values up to a total size in bytes; the least recently used values are evicted first
+class LRUCache:
+    def __init__(self, maxBytes, sizeOf):
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf        # function that estimates the size of a value in bytes
+        self.__items = OrderedDict()    # key -> (value, size), from the least to the most recently used
+        self.__size = 0
+        self.__lock = threading.Lock()  # callbacks can run in several threads
+
+    def get(self, key):
+        with self.__lock:
+            if key not in self.__items:
+                return None
+            self.__items.move_to_end(key)
+            return self.__items[key][0]
+
+    def put(self, key, value):
+        size = self.sizeOf(value)
+        with self.__lock:
+            if key in self.__items:
+                self.__size -= self.__items.pop(key)[1]
+            if size > self.maxBytes:        # would evict everything else and still not fit
+                return
+            self.__items[key] = (value, size)
+            self.__size += size
+            while self.__size > self.maxBytes:
+                self.__size -= self.__items.popitem(last=False)[1][1]
+
+
+# estimates the memory used by a finished schedule and its events
+def scheduleSize(result):
+    schedule, allEvents = result
+    return schedule.schedule.nbytes + 2048 * len(allEvents) + 512 * len(schedule.locations)
+
+# finished schedules, so that downloads do not create the schedule again
+resultCache = LRUCache(200 * 1024 * 1024, scheduleSize)
+
+# folder for the snapshots of finished schedules (set SNAPSHOT_DIR to keep them across restarts); none are saved without it.
+# The least recently used snapshots are deleted once they take more than SNAPSHOT_MAX_MB megabytes
+snapshotFolder = os.environ.get("SNAPSHOT_DIR")
+snapshotMaxBytes = int(os.environ.get("SNAPSHOT_MAX_MB", 1024)) * 1024 * 1024
+if snapshotFolder:
+    os.makedirs(snapshotFolder, exist_ok=True)
+
+# deletes the least recently used snapshots until the rest fit in snapshotMaxBytes; files still being written are skipped
+def pruneSnapshots():
+    snapshots = []
+    for entry in os.scandir(snapshotFolder):
+        if entry.name.endswith(".npz") and entry.name.count(".") == 1:
+            try:
+                snapshots.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except FileNotFoundError:       # deleted by another thread
+                pass
+    total = sum(size for _, size, _ in snapshots)
+    for _, size, path in sorted(snapshots):
+        if total <= snapshotMaxBytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+# estimates the memory used by a parsed upload
+def uploadSize(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return len(json.dumps(value))
+
+# parsed uploads by the hash of their contents, so that callbacks only pass the keys instead of the files
+uploadCache = LRUCache(100 * 1024 * 1024, uploadSize)
+
+# validates an upload with validate(file), which returns a list of problems, and parses its text with parse(text)
+# unless it is already stored; returns the key of the parsed upload (kind and hash of the contents) and the problems
+# found, the key is None if there are any
+def storeUpload(kind, contents, validate, parse):
+    key = kind + ":" + hashlib.sha256(contents.encode('utf-8')).hexdigest()
+    if uploadCache.get(key) is None:
+        try:
+            content_type, content_string = contents.split(',')
+            text = base64.b64decode(content_string).decode('utf-8')
+            errors = validate(io.StringIO(text))
+            if errors:
+                return None, errors
+            uploadCache.put(key, parse(text))
+        except Exception as error:
+            return None, [str(error)]
+    return key, []
+
+# lists the problems found in an upload beneath its filename
+def getErrorList(errors):
+    return html.Ul([html.Li(error) for error in errors], style={"font-size": "8pt", 'text-align': 'left'})
+
+# returns a parsed upload by its key
+def getUpload(key):
+    value = uploadCache.get(key)
+    if value is None:
+        raise KeyError("The uploaded file is no longer stored on the server, please upload it again")
+    return value
+
+# timers and counters of all the schedules created by this process
+appStats = ca.ScheduleStats()
+appStatsLock = threading.Lock()
+
+# reports the timers and counters of the schedules created so far as json
+@server.route("/metrics")
+def getAppStats():
+    with appStatsLock:
+        return flask.jsonify(appStats.info())
+
+# raised inside a job that was cancelled, stops its createSchedule run
+class JobCancelled(Exception):
+    pass
+
+# Runs schedule generation in background threads so that a long run does not hold the request that started it.
+# Every job has an id; callbacks poll its progress, cancel it or read its result once it is done. Finished jobs are
+# forgotten expireAfter seconds after they finish, so a repeated request for a result gets the same one until then.
+class JobManager:
+    def __init__(self, workers=2, expireAfter=600):
+        self.__pool = futures.ThreadPoolExecutor(max_workers=workers)
+        self.__jobs = {}    # job id -> dict(future, cancelled, phase, done, total, finished)
+        self.__lock = threading.Lock()
+        self.expireAfter = expireAfter
+
+    # drops the jobs that finished more than expireAfter seconds ago; the lock has to be held
+    def __expire(self):
+        now = time.time()
+        for jobId in [jobId for jobId, job in self.__jobs.items() if job["finished"] and now - job["finished"] > self.expireAfter]:
+            del self.__jobs[jobId]
+
+    # starts function(*args, progress=...) in the pool and returns the id of the job
+    def submit(self, function, *args):
+        jobId = uuid.uuid4().hex
+        job = dict(cancelled=threading.Event(), phase="queued", done=0, total=1, finished=None)
+
+        def progress(phase, done, total):
+            if job["cancelled"].is_set():
+                raise JobCancelled(jobId)
+            job["phase"], job["done"], job["total"] = phase, done, total
+
+        with self.__lock:
+            self.__expire()
+            self.__jobs[jobId] = job
+            job["future"] = self.__pool.submit(function, *args, progress=progress)
+        job["future"].add_done_callback(lambda future: job.update(finished=time.time()))
+        return jobId
+
+    # returns (state, phase, fraction done) of a job; state is one of queued, running, done, failed or unknown
+    def status(self, jobId):
+        with self.__lock:
+            self.__expire()
+            job = self.__jobs.get(jobId)
+        if job is None:
+            return "unknown", None, 0
+        future = job["future"]
+        if not future.done():
+            state = "running" if future.running() else "queued"
+        else:
+            state = "failed" if future.exception() is not None else "done"
+        return state, job["phase"], job["done"] / max(job["total"], 1)
+
+    # forgets a job and asks it to stop; a queued job never starts, a running one stops at its next progress report
+    def cancel(self, jobId):
+        with self.__lock:
+            job = self.__jobs.pop(jobId, None)
+        if job is not None:
+            job["cancelled"].set()
+            job["future"].cancel()
+
+    # returns the result of a finished job (raises the exception of a failed job and KeyError for an unknown one)
+    def result(self, jobId):
+        with self.__lock:
+            job = self.__jobs[jobId]
+        return job["future"].result()
+
+jobs = JobManager()
+
 # to display the data table
 def parseTemplate(filename):
     df = pd.read_csv(filename)
@@ -37,36 +216,13 @@ def parseTemplate(filename):
         html.Hr()  # horizontal line
     ])
 
-#validates the csv file by checking all if all the required columns are present or not
+#validates the csv file in chunks and returns the problems found in it, an empty list if there are none
 def validateEventFile(file):
-    try:
-        data = pd.read_csv(file)
-        if "crs_cde" in data.columns:
-            event = (data['crs_cde'], data['crs_title'], data['crs_enrollment'], data['crs_capacity'],    # creates a Event object of each event in the dataset and adds it to the list
-            data['max_enrollment'], data['begin_tim'],data['end_tim'],  # create a Time object
-                 [data['monday_cde'], data['tuesday_cde'], data['wednesday_cde'], data['thursday_cde'], data['friday_cde']], str(data['bldg_cde']) + " " + str(data['room_cde']),
-                   data['begin_dte'], data['end_dte'])
-        else:
-            event = (data['event_cde'], data['event_title'], data['event_enrollment'], data['event_capacity'],    # creates a Event object of each event in the dataset and adds it to the list
-                 data['max_enrollment'], data['begin_time'], data['end_time'],  # create a Time object
-                 [data['monday_cde'], data['tuesday_cde'], data['wednesday_cde'], data['thursday_cde'], data['friday_cde']], str(data['bldg_cde']) + " " + str(data['room_cde']),
-                 data['begin_date'], data['end_date'])
-    except KeyError:
-        return False
-    except:
-        return False
-    return True
-
-#validates the csv file by checking all if all the required columns are present or not
+    return ca.validateEventTable(file, True)
+
+#validates the csv file in chunks and returns the problems found in it, an empty list if there are none
 def validateLocationFile(file):
-    try:
-        rms = pd.read_csv(file)
-        location = (rms['Location'], rms['Capacity'], splitAColumn(rms['Features'], "/"))
-    except KeyError:
-        return False
-    except:
-        return False
-    return True
+    return ca.validateLocationTable(file)
 
 # Splits a column with a specified delimiter
 splitAColumn = lambda column, delimiter: str(column).split(delimiter)
@@ -197,26 +353,56 @@ controls = [
     dbc.Card([dbc.Button(id='generateButton', color='primary', outline=True, n_clicks=0, children='Generate Schedule'),
              dcc.Markdown("""
                            Events will be placed at random with each click of the generate schedule button
-                           """, style={"font-size": "8pt", 'text-align': "center"})
+                           """, style={"font-size": "8pt", 'text-align': "center"}),
+             dbc.Progress(id='jobProgress', value=0, label="", style={'margin-bottom': '5px'}),
+             dbc.Button(id='cancelButton', color='secondary', outline=True, n_clicks=0, children='Cancel'),
+             dcc.Interval(id='jobPoll', interval=500, disabled=True),
+             dcc.Store(id='job'),
+             dcc.Store(id='doneJob'),
+             html.Div(id='demandReport')
              ]),
     html.Div([
         dbc.Card(dbc.Button("Download Schedule as CSV", id="downloadBtn",color='primary', outline=True, n_clicks=0)),
         dcc.Download(id="download"),
+        html.Div(id="downloadMessage"),
         html.Div([dcc.Markdown("""
               In the CSV under metric column, 1: Events placed in desired location, 2: Events placed in same building, 
               3: Events placed in location preference, 4: Events placed in unpreferred location.
               """, style={"font-size": "8pt", 'text-align': 'center'})]),
     html.Div([
         dbc.Card(dbc.Button("Download Figure", id="downloadFig", color='primary', outline=True)),
-        dcc.Download(id="dwnFig")
+        dcc.Download(id="dwnFig"),
+        html.Div(id="dwnFigMessage")
+    ]),
+    html.Div([
+        dbc.Card(dbc.Button("Download Utilization as CSV", id="downloadUtilBtn", color='primary', outline=True, n_clicks=0)),
+        dcc.Download(id="downloadUtil"),
+        html.Div(id="downloadUtilMessage")
     ])], id = 'dwnButtons'),
-    html.Div(id="displayMetric")
+    html.Div([
+        dbc.Label("View"),
+        dbc.RadioItems(
+            id='viewPicker',
+            options=[{"label": "Events", "value": "Events"}, {"label": "Utilization", "value": "Utilization"}],
+            value="Events",
+            inline=True
+        )]),
+    html.Div(id="displayMetric"),
+    html.Div([
+        dbc.Card(dbc.Button("Compare with previous schedule", id="compareBtn", color='primary', outline=True, n_clicks=0)),
+        html.Div(id="comparison")
+    ])
     ]
 
 title = html.H1("EVENT PLACER", style={'margin-top': 5, 'text-align': 'center', 'font': "Candara", 'align': 'center'})
 app.layout = dbc.Container([
     dbc.Row([dbc.Col(title, md=20)]),
     dcc.Store(id='seed'),
+    dcc.Store(id='courseKey'),
+    dcc.Store(id='roomKey'),
+    dcc.Store(id='jsonKey'),
+    dcc.Store(id='lastRun'),
+    dcc.Store(id='previousRun'),
     dbc.Card(dbc.Row([c for c in controls]), body=True, style={"box-shadow": "2px 2px 2px lightgrey", 'padding':"15px", 'border-radius': '5px', 'position': 'relative'}),
     html.Div([dcc.Graph(id="scheduleGraph")], style={'padding':"15px", 'border-radius': '5px', 'position': 'relative'})
     
@@ -227,81 +413,82 @@ def parse_contents(contents, filename, date):
     return html.Div([html.H6(filename), html.H6(datetime.datetime.fromtimestamp(date))])
 
 
-# displays the csv filename beneath the upload div
+# displays the csv filename beneath the upload div; the file is validated and parsed once and only its key is kept in the page
 @app.callback(Output('output-data1-upload', 'children'),
+              Output('courseKey', 'data'),
               Input('courseFile', 'contents'),
               State('courseFile', 'filename'),
               State('courseFile', 'last_modified'))
 def update_output(content, name, date):
     if content is not None:
-        content_type, content_string = content.split(',')
-        course_decoded = base64.b64decode(content_string)
-        if validateEventFile(io.StringIO(course_decoded.decode('utf-8'))):
+        key, errors = storeUpload("events", content, validateEventFile, lambda text: ca.loadEventTable(io.StringIO(text), True))
+        if key is not None:
             return html.Div([parse_contents(content, name, date),
                              html.Img(src="https://img.icons8.com/stickers/100/000000/checked.png", height="25",
-                                      width="25")])
+                                      width="25")]), key
         return html.Div([parse_contents(content, name, date),
                          html.Img(src="https://img.icons8.com/flat-round/64/000000/delete-sign.png", height="25",
-                                  width="25")])
+                                  width="25"), getErrorList(errors)]), None
+    return None, None
     
 
 # displays the csv filename beneath the upload div
 @app.callback(Output('output-data2-upload', 'children'),
+              Output('roomKey', 'data'),
               Input('roomFile', 'contents'),
               State('roomFile', 'filename'),
               State('roomFile', 'last_modified'))
 def update_output(content, name, date):
     if content is not None:
-        content_type, content_string = content.split(',')
-        course_decoded = base64.b64decode(content_string)
-        if validateLocationFile(io.StringIO(course_decoded.decode('utf-8'))):
+        key, errors = storeUpload("locations", content, validateLocationFile, lambda text: ca.loadLocationTable(io.StringIO(text)))
+        if key is not None:
             return html.Div([parse_contents(content, name, date),
-                             html.Img(src="https://img.icons8.com/stickers/100/000000/checked.png", height="25", width="25")])
+                             html.Img(src="https://img.icons8.com/stickers/100/000000/checked.png", height="25", width="25")]), key
         return html.Div([parse_contents(content, name, date),
-                         html.Img(src="https://img.icons8.com/flat-round/64/000000/delete-sign.png", height="25", width="25")])
+                         html.Img(src="https://img.icons8.com/flat-round/64/000000/delete-sign.png", height="25", width="25"),
+                         getErrorList(errors)]), None
+    return None, None
 
 
 # displays the json filename beneath the upload div
 @app.callback(Output('output-data3-upload', 'children'),
+              Output('jsonKey', 'data'),
               Input('jsonFile', 'contents'),
               State('jsonFile', 'filename'),
               State('jsonFile', 'last_modified'))
 def update_output(list_of_contents, list_of_names, list_of_dates):
     if list_of_contents is not None:
-        return parse_contents(list_of_contents, list_of_names, list_of_dates)
+        key, errors = storeUpload("preferences", list_of_contents, lambda file: [], json.loads)
+        return html.Div([parse_contents(list_of_contents, list_of_names, list_of_dates), getErrorList(errors)]), key
+    return None, None
 
 
-# generates a schedule object for the app to use
-def generateSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseFile, roomFile, jsonFile, seed):
-    print("Current seed:",seed)
-    if (courseFile is not None) and (roomFile is not None):
-        content_type, content_string = courseFile.split(',')
-        course_decoded = base64.b64decode(content_string)
-        #print("Object hash:",hash(schedule))
-
-        content_type, content_string = roomFile.split(',')
-        room_decoded = base64.b64decode(content_string)
-        
-        if jsonFile is not None:
-            content_type, content_string = jsonFile.split(',')
-            json_decoded = base64.b64decode(content_string)
-        else:
-            json_decoded = False
+# creates a schedule without events for the settings picked in the app
+def createEmptySchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, allRooms):
+    startTime = str(scheduleTimeSlider[0]) + ":00"
+    endTime = str(scheduleTimeSlider[1]) + ":00"
+    days = {"Sunday": "Su", "Monday": "M", "Tuesday": "T", "Wednesday":"W", "Thursday":"R", 'Friday':"F", "Saturday":"Sa"}
+    pickedDays = [days[value] for value in dayPicker]
+    return ca.Schedule(allRooms, time=ca.Time(startTime, endTime, pickedDays), interval=int(timeInterval), timeGap=int(timeGap))
 
-        allEvents = ca.getAllEvents(io.StringIO(course_decoded.decode('utf-8')), True)
-        allRooms = ca.getAllLocations(io.StringIO(room_decoded.decode('utf-8')))
 
-        startTime = str(scheduleTimeSlider[0]) + ":00"
-        endTime = str(scheduleTimeSlider[1]) + ":00"
-        days = {"Sunday": "Su", "Monday": "M", "Tuesday": "T", "Wednesday":"W", "Thursday":"R", 'Friday':"F", "Saturday":"Sa"}
-        pickedDays = [days[value] for value in dayPicker]
+# generates a schedule object for the app to use from the stored uploads; the events and locations are created
+# again for every run because a run changes them
+def generateSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed, progress=None):
+    print("Current seed:",seed)
+    if (courseKey is not None) and (roomKey is not None):
+        allEvents = ca.eventsFromTable(getUpload(courseKey))
+        allRooms = ca.locationsFromTable(getUpload(roomKey))
 
-        schedule = ca.Schedule(allRooms, time=ca.Time(startTime, endTime, pickedDays), interval=int(timeInterval), timeGap=int(timeGap))
-        if json_decoded:
-            schedule.locationPreferences = json.loads(json_decoded.decode('utf-8'))
+        schedule = createEmptySchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, allRooms)
+        if jsonKey is not None:
+            schedule.locationPreferences = getUpload(jsonKey)
 
-        schedule.createSchedule(allEvents, seed)
+        schedule.createSchedule(allEvents, seed, progress=progress)
         print("Object hash:",hash(schedule))
+        with appStatsLock:
+            appStats.merge(schedule.stats)
+            appStats.count("schedules")
 
         return schedule, allEvents
     else:
@@ -309,11 +496,51 @@ def generateSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, cours
         allEvents =ca.getAllEvents("templates/Event_Template.csv")
         allRooms = ca.getAllLocations("templates/Location_Template.csv")
         schedule = ca.Schedule(allRooms)
-        schedule.createSchedule(allEvents, seed)
+        schedule.createSchedule(allEvents, seed, progress=progress)
         print("Object hash:",hash(schedule))
+        with appStatsLock:
+            appStats.merge(schedule.stats)
+            appStats.count("schedules")
         return schedule, allEvents
 
 
+# returns a key that identifies a schedule by its uploads and settings
+def getScheduleKey(*inputs):
+    return hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
+
+
+# returns the schedule for the uploads and settings from the cache or a snapshot, or None if it has to be generated again
+def getStoredSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed):
+    key = getScheduleKey(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed)
+    result = resultCache.get(key)
+    snapshot = os.path.join(snapshotFolder, key + ".npz") if snapshotFolder else None
+    if result is None and snapshot and os.path.exists(snapshot):      # saved by this or an earlier run of the app
+        try:
+            schedule = ca.loadSnapshot(snapshot)
+            os.utime(snapshot)      # marks it as recently used for pruneSnapshots
+        except FileNotFoundError:   # pruned in the meantime
+            return None
+        result = (schedule, schedule.events)
+        resultCache.put(key, result)
+    return result
+
+
+# returns the schedule for the uploads and settings, creating it only if it is not in the cache
+def getSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed, progress=None):
+    result = getStoredSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed)
+    if result is None:
+        key = getScheduleKey(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed)
+        snapshot = os.path.join(snapshotFolder, key + ".npz") if snapshotFolder else None
+        result = generateSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed, progress)
+        if snapshot:        # written under another name first, so that no other thread reads a half written file
+            partial = os.path.join(snapshotFolder, key + "." + uuid.uuid4().hex + ".npz")
+            result[0].saveSnapshot(partial)
+            os.replace(partial, snapshot)
+            pruneSnapshots()
+        resultCache.put(key, result)
+    return result
+
+
 @app.callback(
     Output("eventDownload", "data"),
     Input("event-download", "n_clicks"),
@@ -356,62 +583,211 @@ def getMetricsDiv(schedule):
         """, style = {"font-size":'10pt'})])
     ])
 
-# displays the graph in the app
+# returns the figure of the selected view: the events of every room or the utilization heatmap of the buildings
+def getFigure(schedule, view):
+    if view == "Utilization":
+        return schedule.visualizeUtilization()
+    return schedule.visualizeSchedule()
+
+# shows the buildings and capacity tiers that need more rooms at the same time than they have, as soon as both files are uploaded
 @app.callback(
-    Output("displayMetric", "children"),
-    Output("scheduleGraph", "figure"),
-    Output("seed", "data"),
+    Output("demandReport", "children"),
+    Input('courseKey', 'data'),
+    Input('roomKey', 'data'),
+    Input("dayPicker", "value"),
+    Input("scheduleTimeSlider", "value"),
+    Input("timeInterval", "value"),
+    Input("timeGap", "value")
+)
+def showDemandReport(courseKey, roomKey, dayPicker, scheduleTimeSlider, timeInterval, timeGap):
+    if courseKey is None or roomKey is None:
+        return None
+    try:
+        rooms, events = getUpload(roomKey), getUpload(courseKey)
+    except KeyError as error:
+        return dcc.Markdown(error.args[0], style={"font-size": "8pt", 'text-align': "center"})
+    schedule = createEmptySchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, ca.locationsFromTable(rooms))
+    report = schedule.getDemandReport(ca.eventsFromTable(events))
+    report = report[report["Shortfall"] > 0].sort_values("Shortfall", ascending=False).head(10)
+    if report.empty:
+        return dcc.Markdown("Every building has enough rooms for its busiest time.", style={"font-size": "8pt", 'text-align': "center"})
+    return html.Div([
+        dcc.Markdown("Buildings that need more rooms at the same time than they have (overflow goes to UN locations):",
+                     style={"font-size": "8pt", 'text-align': "center"}),
+        dash_table.DataTable(report.to_dict('records'), [{'name': i, 'id': i} for i in report.columns],
+                             style_header={'backgroundColor': 'black', 'color': 'white'},
+                             style_data={'backgroundColor': 'rgb(50, 50, 50)', 'color': 'white'},
+                             style_cell={'font-size': '8pt'})
+    ])
+
+# starts a schedule job on generate, stops it on cancel and polls it until it is done; the finished job is handed to
+# showResult through the doneJob store, so that the polling stops before the figure is built
+@app.callback(
+    Output("job", "data"),
+    Output("doneJob", "data"),
+    Output("jobPoll", "disabled"),
+    Output("jobProgress", "value"),
+    Output("jobProgress", "label"),
     Input("generateButton", "n_clicks"),
+    Input("cancelButton", "n_clicks"),
+    Input("jobPoll", "n_intervals"),
     State("dayPicker", "value"),
     State("scheduleTimeSlider", "value"),
     State("timeInterval", "value"),
     State("timeGap", "value"),
-    State('courseFile', 'contents'),
-    State('roomFile', 'contents'),
-    State('jsonFile', 'contents')
+    State('courseKey', 'data'),
+    State('roomKey', 'data'),
+    State('jsonKey', 'data'),
+    State('job', 'data')
+)
+def generateGraph(nClicks, cancelClicks, nIntervals, dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, job):
+    trigger = dash.callback_context.triggered[0]["prop_id"].split(".")[0] if dash.callback_context.triggered else "generateButton"
+    noUpdate = dash.no_update
+    if trigger == "cancelButton":
+        if job is not None:
+            jobs.cancel(job["id"])
+        return None, noUpdate, True, 0, "Cancelled"
+    if trigger == "generateButton":
+        if job is not None:     # a new run replaces the one still running
+            jobs.cancel(job["id"])
+        seed = round(time.time())
+        run = [dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed]
+        jobId = jobs.submit(getSchedule, *run)
+        return dict(id=jobId, seed=seed, run=run), noUpdate, False, 0, "Queued"
+    if job is None:
+        return noUpdate, noUpdate, True, noUpdate, noUpdate
+    state, phase, fraction = jobs.status(job["id"])
+    if state in ("queued", "running"):
+        return noUpdate, noUpdate, False, round(100 * fraction), phase
+    if state == "unknown":
+        return None, noUpdate, True, 0, "Lost, generate again"
+    if state == "failed":
+        return None, job, True, 0, "Failed"
+    return None, job, True, 100, "Done"
+
+# displays the metrics and the graph of a finished job; the inputs of the last two finished runs are kept for the comparison
+@app.callback(
+    Output("displayMetric", "children"),
+    Output("scheduleGraph", "figure"),
+    Output("seed", "data"),
+    Output("lastRun", "data"),
+    Output("previousRun", "data"),
+    Input("doneJob", "data"),
+    State('viewPicker', 'value'),
+    State('lastRun', 'data'),
+    prevent_initial_call=True,
+)
+def showResult(job, view, lastRun):
+    noUpdate = dash.no_update
+    if jobs.status(job["id"])[0] == "unknown":
+        return html.Div("The schedule is no longer stored on the server, please generate it again"), noUpdate, noUpdate, noUpdate, noUpdate
+    try:
+        schedule, allEvents = jobs.result(job["id"])
+    except Exception as error:
+        return html.Div(str(error)), noUpdate, noUpdate, noUpdate, noUpdate
+    return getMetricsDiv(schedule), getFigure(schedule, view), job["seed"], job["run"], lastRun
+
+# compares the schedule of the last run with the one of the run before it: metrics, moved events and changed locations
+@app.callback(
+    Output("comparison", "children"),
+    Input("compareBtn", "n_clicks"),
+    State("lastRun", "data"),
+    State("previousRun", "data"),
+    prevent_initial_call=True,
 )
-def generateGraph(nClicks, dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseFile, roomFile, jsonFile):
-    seed = round(time.time())
-    schedule, allEvents= generateSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseFile, roomFile, jsonFile, seed)
-    return getMetricsDiv(schedule), schedule.visualizeSchedule(), seed
+def compareRuns(n_clicks, lastRun, previousRun):
+    if lastRun is None or previousRun is None:
+        return dcc.Markdown("Generate two schedules to compare them.", style={"font-size": "8pt", 'text-align': "center"})
+    # both runs are only read back; generating them again here would hold the request for the whole run
+    before, after = getStoredSchedule(*previousRun), getStoredSchedule(*lastRun)
+    if before is None or after is None:
+        return dcc.Markdown("The schedules are no longer stored on the server, please regenerate them first.",
+                            style={"font-size": "8pt", 'text-align': "center"})
+    before, after = before[0], after[0]
+    comparison = before.compareSchedule(after)
+    tables = []
+    for title, df in [("Metrics", comparison["metrics"].rename_axis("Metric").reset_index()),
+                      (f"Moved events ({len(comparison['events'])})", comparison["events"].head(500)),
+                      (f"Changed locations ({len(comparison['locations'])})", comparison["locations"].head(200))]:
+        df = df.astype(object).where(df.notna(), "")     # events only in one schedule have no location or metric in the other
+        tables += [html.H6(title), dash_table.DataTable(df.to_dict('records'), [{'name': i, 'id': i} for i in df.columns],
+                                                        page_size=15, style_table={'overflowX': 'auto'},
+                                                        style_header={'backgroundColor': 'black', 'color': 'white'},
+                                                        style_data={'backgroundColor': 'rgb(50, 50, 50)', 'color': 'white'},
+                                                        style_cell={'font-size': '8pt'})]
+    return html.Div(tables)
+
+# shows why a download failed beneath its button, e.g. that the upload of an evicted schedule has to be uploaded again
+def getDownloadError(error):
+    return dcc.Markdown(error.args[0], style={"font-size": "8pt", 'text-align': "center"})
 
 @app.callback(
     Output("download", "data"),
+    Output("downloadMessage", "children"),
     Input("downloadBtn", "n_clicks"),
     State("dayPicker", "value"),
     State("scheduleTimeSlider", "value"),
     State("timeInterval", "value"),
     State("timeGap", "value"),
-    State('courseFile', 'contents'),
-    State('roomFile', 'contents'),
-    State('jsonFile', 'contents'),
+    State('courseKey', 'data'),
+    State('roomKey', 'data'),
+    State('jsonKey', 'data'),
     State('seed', 'data'),
     prevent_initial_call=True,
 )
-def downloadCSV(n_clicks, dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseFile, roomFile, jsonFile, seed):
-    schedule, allEvents = generateSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseFile, roomFile, jsonFile, seed)
+def downloadCSV(n_clicks, dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed):
+    try:
+        schedule, allEvents = getSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed)
+    except KeyError as error:       # the schedule has to be generated again but its upload is gone too
+        return dash.no_update, getDownloadError(error)
     file = schedule.exportToCSV(allEvents)
-    return dcc.send_data_frame(file, "classroom.csv")
+    return dcc.send_data_frame(file, "classroom.csv"), None
 
 @app.callback(
     Output("dwnFig", "data"),
+    Output("dwnFigMessage", "children"),
     Input("downloadFig", "n_clicks"),
     State("dayPicker", "value"),
     State("scheduleTimeSlider", "value"),
     State("timeInterval", "value"),
     State("timeGap", "value"),
-    State('courseFile', 'contents'),
-    State('roomFile', 'contents'),
-    State('jsonFile', 'contents'),
+    State('courseKey', 'data'),
+    State('roomKey', 'data'),
+    State('jsonKey', 'data'),
     State('seed', 'data'),
+    State('viewPicker', 'value'),
     prevent_initial_call=True,
 )
-def downloadGraph(n_clicks, dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseFile, roomFile, jsonFile, seed):
-    schedule, allEvents = generateSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseFile, roomFile, jsonFile, seed)
-    fig = schedule.visualizeSchedule()
+def downloadGraph(n_clicks, dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed, view):
+    try:
+        schedule, allEvents = getSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed)
+    except KeyError as error:
+        return dash.no_update, getDownloadError(error)
+    fig = getFigure(schedule, view)
     filename = "schedule figure.html"
     fig.write_html(filename)
-    return dict(content=fig.to_html(), filename=filename)
+    return dict(content=fig.to_html(), filename=filename), None
+
+@app.callback(
+    Output("downloadUtil", "data"),
+    Output("downloadUtilMessage", "children"),
+    Input("downloadUtilBtn", "n_clicks"),
+    State("dayPicker", "value"),
+    State("scheduleTimeSlider", "value"),
+    State("timeInterval", "value"),
+    State("timeGap", "value"),
+    State('courseKey', 'data'),
+    State('roomKey', 'data'),
+    State('jsonKey', 'data'),
+    State('seed', 'data'),
+    prevent_initial_call=True,
+)
+def downloadUtilization(n_clicks, dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed):
+    try:
+        schedule, allEvents = getSchedule(dayPicker, scheduleTimeSlider, timeInterval, timeGap, courseKey, roomKey, jsonKey, seed)
+    except KeyError as error:
+        return dash.no_update, getDownloadError(error)
+    return dcc.send_data_frame(schedule.exportUtilizationCSV(), "utilization.csv"), None
 
 # Running the server
 if __name__ == "__main__":